@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Contents of the build cache file after files are renamed, and build journal replayed after
+interrupted builds
+"""
+
+import glob, os, time, unittest
+from waftest import WafTestCase, HAS_CC
+
+WSCRIPT = '''top = '.'
+out = 'build'
+from waflib import Build, Node
+Node.STAT_SLACK = 0 # record the files written by the test
+def options(opt):
+	opt.load('compiler_c')
+def configure(conf):
+	conf.load('compiler_c')
+def build(bld):
+	bld.program(source=bld.path.ant_glob('src/*.c'), includes='inc', target='app')
+
+class sigs(Build.BuildContext):
+	cmd = 'sigs'
+	def execute(self):
+		self.restore()
+		for x in sorted(self.file_sigs, key=lambda x: x.abspath()):
+			print('sig: ' + x.path_from(self.path).replace('\\\\', '/'))
+'''
+
+@unittest.skipUnless(HAS_CC, 'a C compiler is required')
+class FileSigsTest(WafTestCase):
+
+	def test_renamed_files(self):
+		self.write('wscript', WSCRIPT)
+		self.write('inc/a.h', '#define A 1\n')
+		self.write('src/main.c', '#include "a.h"\nint main(void) { return A - 1; }\n')
+		time.sleep(0.1)
+		self.waf('configure')
+		self.waf('build')
+		out = self.waf('sigs')
+		self.assertIn('sig: src/main.c', out)
+		self.assertIn('sig: inc/a.h', out)
+
+		self.write('inc/b.h', '#define A 1\n')
+		self.write('src/app.c', '#include "b.h"\nint main(void) { return A - 1; }\n')
+		os.remove(self.path('src/main.c'))
+		time.sleep(0.1)
+		self.waf('build')
+		out = self.waf('sigs')
+		self.assertIn('sig: src/app.c', out)
+		self.assertIn('sig: inc/b.h', out)
+		self.assertNotIn('sig: src/main.c', out)
+		self.assertNotIn('sig: inc/a.h', out)
+
+@unittest.skipUnless(HAS_CC, 'a C compiler is required')
+class JournalTest(WafTestCase):
+
+	def test_interrupted_build(self):
+		self.write('wscript', WSCRIPT + 'Build.JOURNAL_RATIO = 100\n')
+		for i in range(5):
+			self.write('src/f%d.c' % i, 'int f%d(void) { return 0; }\n' % i)
+		self.write('src/main.c', 'int main(void) { return 0; }\n')
+		self.waf('configure')
+		self.waf('build')
+
+		# the build fails, the other files are compiled
+		for i in range(5):
+			self.write('src/f%d.c' % i, 'int f%d(void) { return 1; }\n' % i)
+		self.write('src/main.c', 'int main(void) { return error; }\n')
+		self.assertRaises(AssertionError, self.waf, 'build', '-k')
+		journal = glob.glob(self.path('build/.wafpickle-*.log'))
+		self.assertEqual(len(journal), 1)
+
+		# the records of the journal are replayed, and an incomplete record is ignored
+		with open(journal[0], 'ab') as f:
+			f.write(b'\x00\x00\xff\xffxyz')
+		self.write('src/main.c', 'int main(void) { return 0; }\n')
+		out = self.waf('build', '-j1')
+		self.assertEqual(out.count('Compiling'), 1)
+		self.assertIn('src/main.c', out)
+		self.assertNotIn('Compiling', self.waf('build'))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Configuration tests executed in parallel, replayed and batched
+"""
+
+import os, unittest
+from waftest import WafTestCase, HAS_CC, which
+
+PKGS = ('zlib', 'expat', 'libffi', 'fontconfig', 'freetype2')
+
+def has_pc(name):
+	return os.system('pkg-config --exists %s' % name) == 0
+
+COUNTER = '''#!/bin/sh
+echo "$@" >> %s
+exec %s "$@"
+'''
+
+WSCRIPT_CFG = '''top = '.'
+out = 'build'
+def configure(conf):
+	conf.load('c_config')
+	conf.find_program('pkg-config', var='PKGCONFIG', path_list=[%r])
+	conf.defer_checks()
+	for x in %r:
+		conf.check_cfg(package=x, args='--cflags --libs', uselib_store=x.upper(), mandatory=False)
+	conf.commit_checks()
+'''
+
+@unittest.skipUnless(which('pkg-config') and all(has_pc(x) for x in PKGS), 'pkg-config and %s are required' % ', '.join(PKGS))
+class PkgConfigTest(WafTestCase):
+
+	def count_calls(self, jobs):
+		log = self.path('calls.log')
+		if os.path.exists(log):
+			os.remove(log)
+		self.waf('configure', '-j%d' % jobs)
+		with open(log) as f:
+			return len(f.readlines())
+
+	def test_parallel_calls(self):
+		real = [os.path.join(d, 'pkg-config') for d in os.environ['PATH'].split(os.pathsep)
+			if os.path.isfile(os.path.join(d, 'pkg-config'))][0]
+		self.write('bin/pkg-config', COUNTER % (self.path('calls.log'), real))
+		os.chmod(self.path('bin/pkg-config'), 0o755)
+		self.write('wscript', WSCRIPT_CFG % (self.path('bin'), PKGS))
+
+		# the parallel tests do not execute pkg-config again
+		self.assertEqual(self.count_calls(4), self.count_calls(1))
+
+PC_FILES = {
+	'a': 'Requires: b, c >= 1.0\nLibs: -L/opt/a -la -pthread\nCflags: -I/opt/a/inc -DA=1 -pthread\n',
+	'b': 'Requires: d\nRequires.private: e\nLibs: -L/opt/b -lb -ld\nCflags: -I/opt/b -I/usr/include -DB\n',
+	'c': 'Requires: d\nLibs: -L/opt/c -lc -Wl,--as-needed\nCFlags: -I/opt/c -I/opt/a/inc\n',
+	'd': 'Libs: -L/usr/lib -L/opt/d -ld -lm\nCflags: -I/opt/d -DD\n',
+	'e': 'Libs: -le\nCflags: -I${prefix}/e -DE\n',
+}
+
+WSCRIPT_PC = '''top = '.'
+out = 'build'
+def configure(conf):
+	conf.load('c_config')
+	conf.find_program('pkg-config', var='PKGCONFIG', path_list=[%r])
+	for x in ('a', 'c d', 'd a'):
+		conf.check_cfg(package=x, args='--cflags --libs', uselib_store='PC', pkg_config_path=%r)
+		# the variable is not used, but pkg-config is executed
+		conf.check_cfg(package=x, args='--cflags --libs', uselib_store='EXE', pkg_config_path=%r, define_variable={'unused': '1'})
+		assert all(conf.env[k + '_PC'] == conf.env[k + '_EXE'] for k in ('INCLUDES', 'DEFINES', 'LIB', 'LIBPATH', 'CFLAGS', 'LINKFLAGS')), x
+'''
+
+def is_pkgconf():
+	return os.system('pkg-config --dump-personality > %s 2>&1' % os.devnull) == 0
+
+@unittest.skipUnless(which('pkg-config') and is_pkgconf(), 'pkgconf is required')
+class PcFilesTest(WafTestCase):
+
+	def test_flags(self):
+		real = [os.path.join(d, 'pkg-config') for d in os.environ['PATH'].split(os.pathsep)
+			if os.path.isfile(os.path.join(d, 'pkg-config'))][0]
+		self.write('bin/pkg-config', COUNTER % (self.path('calls.log'), real))
+		os.chmod(self.path('bin/pkg-config'), 0o755)
+		for (name, txt) in PC_FILES.items():
+			self.write('pc/%s.pc' % name, 'prefix=/opt\nName: %s\nVersion: 1.0\nDescription: x\n%s' % (name, txt))
+		self.write('wscript', WSCRIPT_PC % (self.path('bin'), self.path('pc'), self.path('pc')))
+
+		# the flags are read from the .pc files, the output of pkg-config is the same
+		self.waf('configure')
+		with open(self.path('calls.log')) as f:
+			calls = f.read()
+		self.assertEqual(calls.count('--define-variable'), 3)
+		self.assertEqual(calls.count('--cflags'), 3)
+
+WSCRIPT_INC = '''top = '.'
+out = 'build'
+def options(opt):
+	opt.load('compiler_c')
+def configure(conf):
+	conf.load('compiler_c')
+	conf.check(header_name='stdio.h')
+	conf.check(header_name='foo.h', includes=[conf.path.find_node('inc').abspath()], mandatory=%r)
+'''
+
+@unittest.skipUnless(HAS_CC, 'a C compiler is required')
+class IncrementalTest(WafTestCase):
+
+	def configure(self):
+		out = self.waf('configure', '--incremental')
+		with open(self.path('build/config.log')) as f:
+			return out + f.read()
+
+	def cache(self):
+		with open(self.path('build/c4che/_cache.py')) as f:
+			return f.read()
+
+	def test_failed_test(self):
+		self.write('inc/bar.h', '')
+		self.write('wscript', WSCRIPT_INC % False)
+		self.configure()
+		self.assertNotIn('HAVE_FOO_H=1', self.cache())
+
+		# the failed test is executed again, the other one is replayed
+		out = self.configure()
+		self.assertIn('incremental: replaying check', out)
+		self.assertIn('foo.h', out)
+		self.assertNotIn('Reusing the previous configuration', out)
+
+		# the header is found once created
+		self.write('inc/foo.h', '')
+		self.configure()
+		self.assertIn('HAVE_FOO_H=1', self.cache())
+
+	def test_reuse(self):
+		self.write('inc/foo.h', '')
+		self.write('wscript', WSCRIPT_INC % True)
+		self.configure()
+		out = self.configure()
+		self.assertIn('Reusing the previous configuration', out)
+
+		# removing the header invalidates the configuration
+		os.remove(self.path('inc/foo.h'))
+		with self.assertRaises(AssertionError) as e:
+			self.configure()
+		self.assertIn('foo.h', str(e.exception))
+
+WSCRIPT_PROBE = '''top = '.'
+out = 'build'
+def options(opt):
+	opt.load('compiler_c')
+def configure(conf):
+	conf.load('compiler_c')
+	conf.defer_checks()
+	for x in %r:
+		conf.check(header_name=x, auto_add_header_name=True, mandatory=False)
+	conf.commit_checks()
+'''
+
+HEADERS = ('stdio.h', 'stdlib.h', 'string.h', 'math.h', 'errno.h', 'waf_missing_header.h')
+
+@unittest.skipUnless(which('gcc'), 'gcc is required')
+class ProbeTest(WafTestCase):
+
+	def test_auto_add_header_name(self):
+		self.write('wscript', WSCRIPT_PROBE % (HEADERS,))
+		self.waf('configure')
+		with open(self.path('build/config.log')) as f:
+			log = f.read()
+		# the headers added to INCKEYS by the previous tests do not prevent using the probes
+		self.assertEqual(log.count('using the result of the compiler probe'), len(HEADERS))
+
+	def test_interrupted(self):
+		self.write('wscript', WSCRIPT_PROBE % (HEADERS,))
+		self.write('build/.conf_probe/0/probe.c', '')
+		out = self.waf('configure')
+		self.assertIn('waf_missing_header.h', out)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Builds c files depending on generated headers when the dependencies are read from depfiles
+"""
+
+import unittest
+from waftest import WafTestCase, HAS_CC
+
+WSCRIPT = '''top = '.'
+out = 'build'
+def options(opt):
+	opt.load('compiler_c')
+def configure(conf):
+	conf.load('compiler_c')
+def build(bld):
+	bld(rule='sleep 1 && echo "#define GEN %s" > ${TGT}', target='gen/gen.h')
+	bld.program(source='main.c', includes='. gen', target='app')
+'''
+
+@unittest.skipUnless(HAS_CC, 'a C compiler is required')
+class DepfileTest(WafTestCase):
+
+	def setUp(self):
+		WafTestCase.setUp(self)
+		self.write('main.c', '#include "gen.h"\nint main(void) { return GEN; }\n')
+
+	def test_generated_header(self):
+		self.write('wscript', WSCRIPT % 0)
+		self.waf('configure')
+		out = self.waf('build', '-j4', '-v')
+		self.assertIn('-MMD', out)
+
+		# the header is now found through the depfile
+		self.write('wscript', WSCRIPT % 1)
+		out = self.waf('build', '-j4')
+		self.assertIn('main.c', out)
+		out = self.waf('build', '-j4')
+		self.assertNotIn('main.c', out)
+
+if __name__ == '__main__':
+	unittest.main()
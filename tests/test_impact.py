@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Runs ``waf impact`` on a small C project after the build cache file was rewritten (compaction),
+and checks that the index of the dependencies is updated
+"""
+
+import os, unittest
+from waftest import WafTestCase, HAS_CC
+
+WSCRIPT = '''top = '.'
+out = 'build'
+from waflib import Build
+Build.JOURNAL_RATIO = 0 # rewrite the build cache file on each build
+def options(opt):
+	opt.load('compiler_c')
+def configure(conf):
+	conf.load('compiler_c')
+	if %r:
+		conf.env.CC_DEPS_F = [] # scan the files with c_preproc
+def build(bld):
+	bld.program(source=bld.path.ant_glob('src/*.c'), includes='inc', target='app')
+
+class index(Build.BuildContext):
+	cmd = 'index'
+	def execute(self):
+		self.restore()
+		for x in ('common.h', 'other.h'):
+			print('%%s: %%d entries' %% (x, len(self.rev_deps.get(self.path.find_node('inc/' + x).abspath(), []))))
+'''
+
+COUNT = 40
+
+@unittest.skipUnless(HAS_CC, 'a C compiler is required')
+class ImpactTest(WafTestCase):
+
+	def setUp(self):
+		WafTestCase.setUp(self)
+		self.write('inc/common.h', '#define COMMON 1\n')
+		self.write('inc/other.h', '#define OTHER 1\n')
+		for i in range(COUNT):
+			self.write('src/f%d.c' % i, '#include "common.h"\nint f%d(void) { return COMMON; }\n' % i)
+		self.write('src/main.c', '#include "other.h"\nint main(void) { return OTHER - 1; }\n')
+
+	def run_impact(self, c_preproc):
+		self.write('wscript', WSCRIPT % c_preproc)
+		self.waf('configure')
+		self.waf('build')
+
+		# the node table is restored and written again
+		self.write('inc/other.h', '#define OTHER 2\n')
+		self.waf('build')
+
+		out = self.waf('impact', 'inc/common.h', 'inc/other.h')
+		self.assertIn('inc/common.h: %d tasks' % COUNT, out)
+		self.assertIn('inc/other.h: 1 task', out)
+
+	def test_stale_entries(self):
+		self.write('wscript', WSCRIPT % False)
+		self.waf('configure')
+		self.waf('build')
+		self.assertIn('common.h: %d entries' % COUNT, self.waf('index'))
+
+		# a file does not include the header anymore, another one is removed
+		self.write('src/f0.c', '#include "other.h"\nint f0(void) { return OTHER; }\n')
+		os.remove(self.path('src/f1.c'))
+		self.waf('build')
+		out = self.waf('index')
+		self.assertIn('common.h: %d entries' % (COUNT - 2), out)
+		self.assertIn('other.h: 2 entries', out)
+
+	def test_depfiles(self):
+		self.run_impact(False)
+
+	def test_c_preproc(self):
+		self.run_impact(True)
+
+if __name__ == '__main__':
+	unittest.main()
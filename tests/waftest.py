@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Helpers for the tests running waf on small projects created in temporary folders
+"""
+
+import os, shutil, subprocess, sys, tempfile, unittest
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAUNCHER = '''import os, sys
+sys.path.insert(0, %r)
+from waflib import Context, Scripting
+Scripting.waf_entry_point(os.getcwd(), Context.WAFVERSION, %r)
+''' % (TOP, TOP)
+
+def which(name):
+	for d in os.environ.get('PATH', '').split(os.pathsep):
+		if os.path.isfile(os.path.join(d, name)):
+			return True
+	return False
+
+HAS_CC = which('gcc') or which('cc')
+
+class WafTestCase(unittest.TestCase):
+	"""
+	Creates a project folder with a waf launcher using the waflib of this repository
+	"""
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp(prefix='waf_test')
+		self.write('waf', LAUNCHER)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def path(self, name):
+		return os.path.join(self.dir, name)
+
+	def write(self, name, txt):
+		path = self.path(name)
+		if not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		with open(path, 'w') as f:
+			f.write(txt)
+
+	def waf(self, *k, **kw):
+		env = dict(os.environ)
+		env.update(kw.get('env', {}))
+		try:
+			return subprocess.check_output([sys.executable, 'waf'] + list(k), cwd=self.dir,
+				stderr=subprocess.STDOUT, universal_newlines=True, env=env)
+		except subprocess.CalledProcessError as e:
+			self.fail('waf %s failed:\n%s' % (' '.join(k), e.output))
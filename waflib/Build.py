@@ -9,7 +9,7 @@ The inheritance tree is the following:
 
 """
 
-import os, sys, errno, re, shutil, stat
+import io, os, sys, errno, re, shutil, stat, struct
 try:
 	import cPickle
 except ImportError:
@@ -28,11 +28,18 @@ INSTALL = 1337
 UNINSTALL = -1337
 """Negative value '<-' uninstall, see :py:attr:`waflib.Build.BuildContext.is_install`"""
 
-SAVED_ATTRS = 'root node_sigs task_sigs imp_sigs raw_deps node_deps'.split()
+SAVED_ATTRS = 'root node_sigs task_sigs imp_sigs raw_deps node_deps rev_deps task_times task_rss file_sigs'.split()
 """Build class members to save between the runs; these should be all dicts
 except for `root` which represents a :py:class:`waflib.Node.Node` instance
+(the node tree is written as a :py:class:`waflib.Node.NodeTable` at the beginning of the build cache file)
 """
 
+JOURNAL_SUFFIX = '.log'
+"""Suffix of the build journal, in which the records changed by each build are appended to the build cache file :py:const:`waflib.Context.DBFILE`"""
+
+JOURNAL_RATIO = 0.5
+"""The build cache file is rewritten and the journal is discarded when the journal grows larger than this fraction of the build cache file"""
+
 CFG_FILES = 'cfg_files'
 """Files from the build directory to hash before starting the build (``config.h`` written during the configuration)"""
 
@@ -46,6 +53,83 @@ PROTOCOL = -1
 if sys.platform == 'cli':
 	PROTOCOL = 0
 
+class journaled_dict(dict):
+	"""
+	Dict recording the keys that are set or removed, so that only the records
+	that changed are written to the build journal (see :py:meth:`waflib.Build.BuildContext.store`).
+	Instances are serialized as plain dicts.
+	"""
+	__slots__ = ('changed',)
+	def __init__(self, *k, **kw):
+		dict.__init__(self, *k, **kw)
+		self.changed = set()
+	def __setitem__(self, key, value):
+		dict.__setitem__(self, key, value)
+		self.changed.add(key)
+	def __delitem__(self, key):
+		dict.__delitem__(self, key)
+		self.changed.add(key)
+	def __reduce__(self):
+		return (dict, (dict(self),))
+	def pop(self, key, *k):
+		self.changed.add(key)
+		return dict.pop(self, key, *k)
+	def popitem(self):
+		ret = dict.popitem(self)
+		self.changed.add(ret[0])
+		return ret
+	def setdefault(self, key, default=None):
+		if key not in self:
+			self[key] = default
+		return dict.__getitem__(self, key)
+	def update(self, *k, **kw):
+		for key, value in dict(*k, **kw).items():
+			self[key] = value
+	def clear(self):
+		self.changed.update(self)
+		dict.clear(self)
+
+class lazy_dict(journaled_dict):
+	"""
+	Journaled dict restored from the build cache file, in which the lists of nodes are stored
+	as :py:class:`waflib.Node.node_ids`; the lists are converted to nodes when accessed.
+	"""
+	__slots__ = ('table',)
+	def __init__(self, table, *k, **kw):
+		journaled_dict.__init__(self, *k, **kw)
+		self.table = table
+	def __getitem__(self, key):
+		val = dict.__getitem__(self, key)
+		if isinstance(val, Node.node_ids):
+			val = self.table.decode(val)
+			dict.__setitem__(self, key, val)
+		return val
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+	def pop(self, key, *k):
+		val = journaled_dict.pop(self, key, *k)
+		if isinstance(val, Node.node_ids):
+			val = self.table.decode(val)
+		return val
+	def popitem(self):
+		key, val = journaled_dict.popitem(self)
+		if isinstance(val, Node.node_ids):
+			val = self.table.decode(val)
+		return (key, val)
+	def setdefault(self, key, default=None):
+		if key not in self:
+			self[key] = default
+		return self[key]
+	def copy(self):
+		return dict(self.items())
+	def values(self):
+		return [self[k] for k in self]
+	def items(self):
+		return [(k, self[k]) for k in self]
+
 class BuildContext(Context.Context):
 	'''executes the build'''
 
@@ -83,21 +167,39 @@ class BuildContext(Context.Context):
 		# ======================================= #
 		# cache variables
 
-		self.node_sigs = {}
+		self.node_sigs = journaled_dict()
 		"""Dict mapping build nodes to task identifier (uid), it indicates whether a task created a particular file (persists across builds)"""
 
-		self.task_sigs = {}
+		self.task_sigs = journaled_dict()
 		"""Dict mapping task identifiers (uid) to task signatures (persists across builds)"""
 
-		self.imp_sigs = {}
+		self.imp_sigs = journaled_dict()
 		"""Dict mapping task identifiers (uid) to implicit task dependencies used for scanning targets (persists across builds)"""
 
-		self.node_deps = {}
+		self.node_deps = journaled_dict()
 		"""Dict mapping task identifiers (uid) to node dependencies found by :py:meth:`waflib.Task.Task.scan` (persists across builds)"""
 
-		self.raw_deps = {}
+		self.raw_deps = journaled_dict()
 		"""Dict mapping task identifiers (uid) to custom data returned by :py:meth:`waflib.Task.Task.scan` (persists across builds)"""
 
+		self.rev_deps = journaled_dict()
+		"""Dict mapping the absolute paths of the files returned by the scanners to the identifiers (uid) of the tasks depending on them (persists across builds), see :py:meth:`waflib.Build.BuildContext.get_rev_deps`"""
+
+		self.task_times = journaled_dict()
+		"""Dict mapping task identifiers (uid) to the duration in seconds of their last successful execution (persists across builds)"""
+
+		self.task_rss = journaled_dict()
+		"""Dict mapping task identifiers (uid) to the peak memory in kilobytes used by the processes of their last successful execution (persists across builds)"""
+
+		self.file_sigs = journaled_dict()
+		"""Dict mapping nodes to the size, modification time and inode of the file when its contents were hashed, and the hash (persists across builds), see :py:meth:`waflib.Node.Node.h_file_stat`"""
+
+		self.file_sigs_used = set()
+		"""Nodes for which :py:attr:`waflib.Build.BuildContext.file_sigs` was used during the build, see :py:meth:`waflib.Build.BuildContext.evict_file_sigs`"""
+
+		self.scan_results = {}
+		"""Dict mapping task identifiers (uid) to scanner results computed ahead of :py:meth:`waflib.Task.Task.sig_implicit_deps`, see :py:meth:`waflib.Runner.Parallel.scan_group`"""
+
 		self.task_gen_cache_names = {}
 
 		self.jobs = Options.options.jobs
@@ -109,6 +211,9 @@ class BuildContext(Context.Context):
 		self.keep = Options.options.keep
 		"""Whether the build should continue past errors"""
 
+		self.memory_budget = Options.options.memory_budget
+		"""Amount of memory in megabytes that the tasks running in parallel may use, 0 for no limit"""
+
 		self.progress_bar = Options.options.progress_bar
 		"""
 		Level of progress status:
@@ -141,7 +246,7 @@ class BuildContext(Context.Context):
 
 		for v in SAVED_ATTRS:
 			if not hasattr(self, v):
-				setattr(self, v, {})
+				setattr(self, v, journaled_dict())
 
 	def get_variant_dir(self):
 		"""Getter for the variant_dir attribute"""
@@ -264,7 +369,8 @@ class BuildContext(Context.Context):
 
 	def restore(self):
 		"""
-		Load data from a previous run, sets the attributes listed in :py:const:`waflib.Build.SAVED_ATTRS`
+		Load data from a previous run, sets the attributes listed in :py:const:`waflib.Build.SAVED_ATTRS`.
+		The records of the build journal are applied over the data of the build cache file.
 		"""
 		try:
 			env = ConfigSet.ConfigSet(os.path.join(self.cache_dir, 'build.config.py'))
@@ -277,44 +383,328 @@ class BuildContext(Context.Context):
 			for t in env.tools:
 				self.setup(**t)
 
+			Utils.set_sig_hash(env.sig_hash or 'md5')
+
 		dbfn = os.path.join(self.variant_dir, Context.DBFILE)
 		try:
-			data = Utils.readf(dbfn, 'rb')
-		except (EnvironmentError, EOFError):
+			data = self.load_db(dbfn)
+			table = Node.NodeTable(data)
+		except (EnvironmentError, EOFError, ValueError, struct.error):
 			# handle missing file/empty file
 			Logs.debug('build: Could not load the build cache %s (missing)', dbfn)
 		else:
+			table.attach(self.root)
+			root = self.root
+			def persistent_load(pid):
+				if isinstance(pid, str):
+					return root.make_node(pid)
+				return table.node(pid)
+			unpickler = cPickle.Unpickler(io.BytesIO(data[table.end:]))
+			unpickler.persistent_load = persistent_load
 			try:
-				Node.pickle_lock.acquire()
-				Node.Nod3 = self.node_class
-				try:
-					data = cPickle.loads(data)
-				except Exception as e:
-					Logs.debug('build: Could not pickle the build cache %s: %r', dbfn, e)
-				else:
-					for x in SAVED_ATTRS:
+				data = unpickler.load()
+			except Exception as e:
+				Logs.debug('build: Could not pickle the build cache %s: %r', dbfn, e)
+				root.children = root.dict_class()
+			else:
+				self.node_table = table
+				if data.get('sig_hash', 'md5') != Utils.sig_hash_name:
+					# the task identifiers and signatures are different
+					Logs.debug('build: Ignoring the build cache %s (signature hash changed)', dbfn)
+					data = {}
+				for x in SAVED_ATTRS:
+					if x != 'root':
 						setattr(self, x, data.get(x, {}))
-			finally:
-				Node.pickle_lock.release()
+				self.db_generation = data.get('generation')
+
+			if getattr(self, 'db_generation', None):
+				self.replay_journal(dbfn + JOURNAL_SUFFIX)
+
+			for x in SAVED_ATTRS:
+				val = getattr(self, x)
+				if isinstance(val, dict):
+					setattr(self, x, lazy_dict(table, val))
 
 		self.init_dirs()
 
+	def load_db(self, fname):
+		"""
+		Returns the contents of the build cache file; the file is memory-mapped
+		so that only the parts of the node tree in use are read from the disk.
+		Windows cannot replace a file that is mapped, so it is read at once there,
+		as well as when the mmap module is unavailable or the mapping fails.
+
+		:param fname: path to the build cache file
+		:type fname: string
+		:rtype: mmap or bytes
+		"""
+		with open(fname, 'rb') as f:
+			if not Utils.is_win32:
+				try:
+					import mmap
+					return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				except (ImportError, EnvironmentError, ValueError):
+					# empty files, file systems without mmap support
+					pass
+			return f.read()
+
+	def replay_journal(self, fname):
+		"""
+		Applies the records of the build journal written by :py:meth:`waflib.Build.BuildContext.store_journal`.
+		Incomplete records (interrupted builds) and records of other build cache files are ignored;
+		the records appended after an incomplete one could not be read, so the build cache file is
+		rewritten by the next :py:meth:`waflib.Build.BuildContext.store`.
+
+		:param fname: path to the journal file
+		:type fname: string
+		"""
+		try:
+			data = Utils.readf(fname, 'rb')
+		except EnvironmentError:
+			return
+		self.db_journal_size = len(data)
+
+		root = self.root
+		def persistent_load(path):
+			return root.make_node(path)
+
+		pos = 0
+		while pos + 4 <= len(data):
+			size = struct.unpack('>I', data[pos:pos + 4])[0]
+			pos += 4
+			if pos + size > len(data):
+				Logs.debug('build: Ignoring an incomplete record in %s', fname)
+				break
+			unpickler = cPickle.Unpickler(io.BytesIO(data[pos:pos + size]))
+			unpickler.persistent_load = persistent_load
+			pos += size
+			try:
+				generation, changes = unpickler.load()
+			except Exception as e:
+				Logs.debug('build: Could not load the build journal %s: %r', fname, e)
+				pos = -1
+				break
+			if generation != self.db_generation:
+				continue
+			for x, (updated, removed) in changes.items():
+				table = getattr(self, x, None)
+				if table is None:
+					table = {}
+					setattr(self, x, table)
+				table.update(updated)
+				for k in removed:
+					table.pop(k, None)
+		self.db_journal_broken = pos != len(data)
+
 	def store(self):
 		"""
-		Store data for next runs, set the attributes listed in :py:const:`waflib.Build.SAVED_ATTRS`. Uses a temporary
-		file to avoid problems on ctrl+c.
+		Store data for next runs, set the attributes listed in :py:const:`waflib.Build.SAVED_ATTRS`.
+		Only the records that changed are appended to the build journal, see :py:meth:`waflib.Build.BuildContext.store_journal`;
+		the whole build cache file is rewritten when the journal becomes too large (compaction).
 		"""
-		data = {}
-		for x in SAVED_ATTRS:
-			data[x] = getattr(self, x)
+		self.evict_file_sigs()
+		self.index_deps()
 		db = os.path.join(self.variant_dir, Context.DBFILE)
+		if not self.store_journal(db):
+			self.store_snapshot(db)
+
+	def evict_file_sigs(self):
+		"""
+		Removes the entries of :py:attr:`waflib.Build.BuildContext.file_sigs` for the files that were
+		not hashed during a complete build (deleted or renamed files), or for the files that do not exist
+		anymore when only some of the tasks were processed
+		"""
+		sigs = self.file_sigs
+		used = self.file_sigs_used
+		producer = getattr(self, 'producer', None)
+		if producer and not producer.error and producer.processed >= producer.total and self.get_task_uids() is not None:
+			lst = [x for x in sigs if not x in used]
+		else:
+			lst = [x for x in sigs if not x in used and not os.path.isfile(x.abspath())]
+		for x in lst:
+			del sigs[x]
+
+	def index_deps(self):
+		"""
+		Updates :py:attr:`waflib.Build.BuildContext.rev_deps` from the dependencies found by the scanners
+		during the build. The entries referring to the tasks scanned again are rebuilt from their current
+		dependencies, and the tasks that are not in the build anymore are removed when all the task
+		generators were posted. The whole index is computed when it is empty (build cache files
+		written by previous versions).
+		"""
+		deps = self.node_deps
+		rev = self.rev_deps
+		if rev:
+			keys = getattr(deps, 'changed', deps)
+		else:
+			keys = deps
+
+		added = {}
+		current = {}
+		for uid in keys:
+			paths = current[uid] = set(node.abspath() for node in deps.get(uid) or ())
+			for path in paths:
+				try:
+					added[path].add(uid)
+				except KeyError:
+					added[path] = set([uid])
+
+		uids = self.get_task_uids()
+		if current or uids is not None:
+			for path, old in list(rev.items()):
+				lst = [uid for uid in old if (uids is None or uid in uids) and (not uid in current or path in current[uid])]
+				new = added.pop(path, None)
+				if new:
+					new.difference_update(lst)
+					lst.extend(sorted(new))
+				if not lst:
+					del rev[path]
+				elif lst != old:
+					rev[path] = lst
+
+		for path, new in added.items():
+			rev[path] = sorted(new)
+
+	def get_task_uids(self):
+		"""
+		Returns the identifiers of all the tasks of the build, see :py:meth:`waflib.Build.BuildContext.index_deps`
+
+		:return: task identifiers (uid), or None if some task generators were not posted
+		:rtype: set
+		"""
+		ret = set()
+		def add(tasks):
+			for tsk in tasks:
+				ret.add(tsk.uid())
+				add(getattr(tsk, 'more_tasks', None) or ())
+		for g in self.groups:
+			for tg in g:
+				if isinstance(tg, Task.Task):
+					add([tg])
+				elif not getattr(tg, 'posted', False):
+					return None
+				else:
+					add(tg.tasks)
+		return ret or None
+
+	def get_rev_deps(self, path):
+		"""
+		Returns the identifiers of the tasks depending on a file according to their last scan,
+		without reading the node lists of the other tasks
+
+		:param path: absolute path of the file
+		:type path: string
+		:return: task identifiers (uid)
+		:rtype: list
+		"""
+		uids = self.rev_deps.get(path)
+		if not uids:
+			return []
+		node = self.root.search_node(path)
+		if node is None:
+			return []
+		table = getattr(self, 'node_table', None)
+		nid = table.find_id(node) if table else -1
+
+		ret = []
+		for uid in uids:
+			val = dict.get(self.node_deps, uid)
+			if isinstance(val, Node.node_ids):
+				if nid >= 0 and nid in struct.unpack('<%di' % (len(val) // 4), val):
+					ret.append(uid)
+			elif val and node in val:
+				ret.append(uid)
+		return ret
 
+	def store_journal(self, db):
+		"""
+		Appends the records modified since the data was loaded to the build journal.
+		Node objects are written as paths.
+
+		:param db: path to the build cache file
+		:type db: string
+		:return: False if the whole build cache file must be rewritten
+		:rtype: bool
+		"""
+		generation = getattr(self, 'db_generation', None)
+		if not generation or getattr(self, 'db_journal_broken', False):
+			return False
+
+		changes = {}
+		for x in SAVED_ATTRS:
+			if x == 'root':
+				continue
+			table = getattr(self, x)
+			if not isinstance(table, journaled_dict):
+				# replaced by a plain dict (waf clean): the changes are unknown
+				return False
+			if table.changed:
+				updated = {}
+				removed = []
+				for k in table.changed:
+					try:
+						updated[k] = dict.__getitem__(table, k)
+					except KeyError:
+						removed.append(k)
+				changes[x] = (updated, removed)
+
+		if not changes:
+			return True
+
+		buf = io.BytesIO()
+		pickler = cPickle.Pickler(buf, PROTOCOL)
+		def persistent_id(obj):
+			if isinstance(obj, Node.Node):
+				return obj.abspath()
+			return None
+		pickler.persistent_id = persistent_id
+		pickler.dump((generation, changes))
+		data = buf.getvalue()
+
+		size = getattr(self, 'db_journal_size', 0) + len(data) + 4
 		try:
-			Node.pickle_lock.acquire()
-			Node.Nod3 = self.node_class
-			x = cPickle.dumps(data, PROTOCOL)
-		finally:
-			Node.pickle_lock.release()
+			if size > os.path.getsize(db) * JOURNAL_RATIO:
+				return False
+		except OSError:
+			return False
+
+		with open(db + JOURNAL_SUFFIX, 'ab') as f:
+			f.write(struct.pack('>I', len(data)) + data)
+		self.db_journal_size = size
+
+		for x in changes:
+			getattr(self, x).changed.clear()
+		return True
+
+	def store_snapshot(self, db):
+		"""
+		Writes all the data to the build cache file and removes the build journal.
+		Uses a temporary file to avoid problems on ctrl+c.
+
+		:param db: path to the build cache file
+		:type db: string
+		"""
+		old = getattr(self, 'node_table', None)
+		table, ids, remap = Node.NodeTable.dump(self.root, old)
+
+		self.db_generation = Utils.to_hex(os.urandom(8))
+		data = {'generation': self.db_generation, 'sig_hash': Utils.sig_hash_name}
+		for x in SAVED_ATTRS:
+			if x != 'root':
+				data[x] = self.encode_nodes(getattr(self, x), ids, remap, old)
+
+		buf = io.BytesIO()
+		pickler = cPickle.Pickler(buf, PROTOCOL)
+		def persistent_id(obj):
+			if isinstance(obj, Node.Node):
+				try:
+					return ids[obj]
+				except KeyError:
+					return obj.abspath()
+			return None
+		pickler.persistent_id = persistent_id
+		pickler.dump(data)
+		x = table + buf.getvalue()
 
 		Utils.writef(db + '.tmp', x, m='wb')
 
@@ -329,6 +719,51 @@ class BuildContext(Context.Context):
 		# do not use shutil.move (copy is not thread-safe)
 		os.rename(db + '.tmp', db)
 
+		try:
+			os.remove(db + JOURNAL_SUFFIX)
+		except OSError:
+			pass
+		self.db_journal_size = 0
+		self.db_journal_broken = False
+
+		for x in SAVED_ATTRS:
+			table = getattr(self, x)
+			if isinstance(table, journaled_dict):
+				table.changed.clear()
+
+	def encode_nodes(self, table, ids, remap, old):
+		"""
+		Returns a copy of a dict to save in which the lists of nodes are replaced
+		by :py:class:`waflib.Node.node_ids`
+
+		:param table: dict to save
+		:type table: dict
+		:param ids: identifiers of the nodes in the new node table
+		:type ids: dict
+		:param remap: identifiers of the previous node table to the new identifiers
+		:type remap: dict
+		:param old: previous node table, if any
+		:type old: :py:class:`waflib.Node.NodeTable`
+		:rtype: dict
+		"""
+		if not isinstance(table, dict):
+			return table
+		ret = {}
+		for k, v in dict.items(table):
+			if isinstance(v, Node.node_ids):
+				try:
+					v = Node.node_ids(Node.pack_ids([remap[nid] for nid in struct.unpack('<%di' % (len(v) // 4), v)]))
+				except KeyError:
+					# evicted nodes
+					v = old.decode(v)
+			if v and isinstance(v, list):
+				try:
+					v = Node.node_ids(Node.pack_ids([ids[n] for n in v]))
+				except (KeyError, TypeError):
+					pass
+			ret[k] = v
+		return ret
+
 	def compile(self):
 		"""
 		Run the build by creating an instance of :py:class:`waflib.Runner.Parallel`
@@ -355,7 +790,13 @@ class BuildContext(Context.Context):
 			raise Errors.BuildError(self.producer.error)
 
 	def is_dirty(self):
-		return self.producer.dirty
+		"""
+		Whether the build data must be saved: when a task was executed, or when file hashes
+		were recorded in :py:attr:`waflib.Build.BuildContext.file_sigs`
+
+		:rtype: bool
+		"""
+		return self.producer.dirty or bool(getattr(self.file_sigs, 'changed', None))
 
 	def setup(self, tool, tooldir=None, funs=None):
 		"""
@@ -1400,6 +1841,70 @@ class ListContext(BuildContext):
 
 			Logs.pprint('GREEN', target, label=descript)
 
+class ImpactContext(BuildContext):
+	'''estimates the rebuild caused by changes to files: waf impact path/to/header.h'''
+	cmd = 'impact'
+
+	def execute(self):
+		"""
+		Reports the tasks depending on the files given after the command (``waf impact path/to/header.h``)
+		from the dependencies found by the previous builds (see :py:meth:`waflib.Build.BuildContext.get_rev_deps`),
+		and estimates the rebuild time from the recorded task durations and the amount of jobs (``-j``).
+		The build scripts are only read to display the tasks (``-v``).
+		"""
+		# the remaining arguments are file names, not commands
+		args = Options.commands[:]
+		del Options.commands[:]
+		if not args:
+			raise Errors.WafError('Missing file names: waf impact path/to/header.h')
+
+		self.restore()
+		self.index_deps()
+		uids = []
+		seen = set()
+		for x in args:
+			path = os.path.normpath(os.path.join(self.launch_dir, x))
+			lst = self.get_rev_deps(path)
+			Logs.pprint('NORMAL', '%s: %d task%s' % (x, len(lst), len(lst) != 1 and 's' or ''))
+			for uid in lst:
+				if not uid in seen:
+					seen.add(uid)
+					uids.append(uid)
+
+		times = self.task_times
+		known = [times[uid] for uid in uids if uid in times]
+		total = sum(known)
+		wall = max([total / max(self.jobs, 1)] + known)
+
+		if Logs.verbose:
+			if not self.all_envs:
+				self.load_envs()
+			self.recurse([self.run_dir])
+			self.pre_build()
+			names = {}
+			for g in self.groups:
+				for tg in g:
+					try:
+						f = tg.post
+					except AttributeError:
+						pass
+					else:
+						f()
+						for tsk in tg.tasks:
+							names[tsk.uid()] = str(tsk).strip()
+			for uid in sorted(uids, key=lambda uid: -times.get(uid, 0)):
+				if uid in times:
+					label = '%.2fs' % times[uid]
+				else:
+					label = 'no duration recorded'
+				Logs.pprint('GREEN', names.get(uid, Utils.to_hex(uid)), label=label)
+
+		msg = '%d task%s to execute again: %.1fs in total, about %.1fs with -j%d' % (
+			len(uids), len(uids) != 1 and 's' or '', total, wall, self.jobs)
+		if len(known) < len(uids):
+			msg += ' (%d without recorded duration)' % (len(uids) - len(known))
+		Logs.pprint('YELLOW', msg)
+
 class StepContext(BuildContext):
 	'''executes tasks in a step-by-step fashion, for debugging'''
 	cmd = 'step'
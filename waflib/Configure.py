@@ -12,8 +12,13 @@ A :py:class:`waflib.Configure.ConfigurationContext` instance is created when ``w
 * hold configuration routines such as ``find_program``, etc
 """
 
-import os, re, shlex, shutil, sys, time, traceback
-from waflib import ConfigSet, Utils, Options, Logs, Context, Build, Errors
+import copy, os, re, shlex, shutil, sys, time, traceback
+from waflib import ConfigSet, Utils, Options, Logs, Context, Build, Errors, Runner, Task
+
+try:
+	import cPickle
+except ImportError:
+	import pickle as cPickle
 
 WAF_CONFIG_LOG = 'config.log'
 """Name of the configuration log file"""
@@ -21,11 +26,57 @@ WAF_CONFIG_LOG = 'config.log'
 autoconfig = False
 """Execute the configuration automatically"""
 
+user_cache = os.environ.get('WAF_CONF_CACHE', '')
+"""
+Folder for the results of the configuration tests shared by the projects of the current user,
+see :py:func:`waflib.Configure.run_build`. The value *1* selects ``~/.cache/waf/conf``, and
+the cache is disabled if the value is empty.
+"""
+
+CONF_RECORD = 'config.record'
+"""Name of the file holding the inputs and the results of the last configuration, see :py:meth:`waflib.Configure.ConfigurationContext.replay_call`"""
+
+incremental_environ = ['PATH', 'PKG_CONFIG_PATH', 'PKG_CONFIG_LIBDIR', 'PKG_CONFIG_SYSROOT_DIR',
+	'CPATH', 'C_INCLUDE_PATH', 'CPLUS_INCLUDE_PATH', 'LIBRARY_PATH']
+"""Environment variables read by the programs executed during the configuration (incremental configuration inputs)"""
+
+incremental_ignore = ['colors', 'jobs', 'keep', 'verbose', 'zones', 'profile', 'pdb', 'whelp', 'incremental',
+	'progress_bar', 'targets', 'files', 'destdir', 'force', 'distcheck_args', 'memory_budget']
+"""Command-line options that do not affect the results of an incremental configuration"""
+
 conf_template = '''# project %(app)s configured on %(now)s by
 # waf %(wafver)s (abi %(abi)s, python %(pyver)x on %(systype)s)
 # using %(args)s
 #'''
 
+class environ_record(dict):
+	"""
+	Copy of ``os.environ`` reporting the variables read to :py:meth:`waflib.Configure.ConfigurationContext.record_environ`
+	"""
+	def __init__(self, ctx, *k):
+		dict.__init__(self, *k)
+		self.ctx = ctx
+	def __getitem__(self, key):
+		self.ctx.record_environ(key)
+		return dict.__getitem__(self, key)
+	def __contains__(self, key):
+		self.ctx.record_environ(key)
+		return dict.__contains__(self, key)
+	def get(self, key, default=None):
+		self.ctx.record_environ(key)
+		return dict.get(self, key, default)
+
+class conf_record(object):
+	"""
+	Inputs of a configuration or of a configuration test (environment variables and files),
+	and console messages of the test, see :py:meth:`waflib.Configure.ConfigurationContext.replay_call`
+	"""
+	def __init__(self):
+		self.environ = {}
+		self.files = set()
+		self.msgs = []
+		self.failed = False
+
 class ConfigurationContext(Context.Context):
 	'''configures the project'''
 
@@ -38,7 +89,7 @@ class ConfigurationContext(Context.Context):
 
 	def __init__(self, **kw):
 		super(ConfigurationContext, self).__init__(**kw)
-		self.environ = dict(os.environ)
+		self.environ = environ_record(self, os.environ)
 		self.all_envs = {}
 
 		self.top_dir = None
@@ -51,6 +102,27 @@ class ConfigurationContext(Context.Context):
 
 		self.tool_cache = []
 
+		self.deferred_checks = None
+		"""Configuration tests queued by :py:meth:`waflib.Configure.ConfigurationContext.defer_checks`"""
+
+		self.check_results = None
+		"""Results of the deferred configuration tests, see :py:meth:`waflib.Configure.ConfigurationContext.commit_checks`"""
+
+		self.probe_results = None
+		"""Results of the batched compiler probes, see :py:func:`waflib.Tools.c_config.probe_checks`"""
+
+		self.records = []
+		"""Active input records of an incremental configuration, see :py:meth:`waflib.Configure.ConfigurationContext.replay_call`"""
+
+		self.previous_calls = {}
+		"""Results of the configuration tests of the previous configuration"""
+
+		self.calls = {}
+		"""Results of the configuration tests to store for the next configuration"""
+
+		self.sigs = {}
+		"""File signatures computed during the configuration"""
+
 		self.setenv('')
 
 	def setenv(self, name, env=None):
@@ -133,6 +205,13 @@ class ConfigurationContext(Context.Context):
 		"""
 		self.init_dirs()
 
+		self.sig_hash = Options.options.sig_hash or 'md5'
+		"""Hash algorithm for the build signatures, see :py:func:`waflib.Utils.set_sig_hash`"""
+		try:
+			Utils.set_sig_hash(self.sig_hash)
+		except Errors.WafError as e:
+			self.fatal(str(e))
+
 		self.cachedir = self.bldnode.make_node(Build.CACHE_DIR)
 		self.cachedir.mkdir()
 
@@ -156,7 +235,18 @@ class ConfigurationContext(Context.Context):
 			if self.srcnode.is_child_of(self.path):
 				Logs.warn('Are you certain that you do not want to set top="." ?')
 
-		super(ConfigurationContext, self).execute()
+		incremental = getattr(Options.options, 'incremental', False)
+		if incremental:
+			self.records.append(conf_record())
+		else:
+			try:
+				os.remove(os.path.join(self.cachedir.abspath(), CONF_RECORD))
+			except OSError:
+				pass
+		if not (incremental and self.reuse_configuration()):
+			super(ConfigurationContext, self).execute()
+			if incremental:
+				self.store_record()
 
 		self.store()
 
@@ -214,8 +304,12 @@ class ConfigurationContext(Context.Context):
 
 	def store(self):
 		"""Save the config results into the cache file"""
+		try:
+			Utils.set_sig_hash(self.sig_hash)
+		except Errors.WafError as e:
+			self.fatal(str(e))
 		n = self.cachedir.make_node('build.config.py')
-		n.write('version = 0x%x\ntools = %r\n' % (Context.HEXVERSION, self.tools))
+		n.write('version = 0x%x\ntools = %r\nsig_hash = %r\n' % (Context.HEXVERSION, self.tools, self.sig_hash))
 
 		if not self.all_envs:
 			self.fatal('nothing to store in the configuration context!')
@@ -299,6 +393,401 @@ class ConfigurationContext(Context.Context):
 				self.fatal('No such configuration function %r' % x)
 			f()
 
+	def start_msg(self, *k, **kw):
+		"""
+		Records the messages for :py:meth:`waflib.Configure.ConfigurationContext.replay_call`,
+		see :py:meth:`waflib.Context.Context.start_msg`
+		"""
+		super(ConfigurationContext, self).start_msg(*k, **kw)
+		if len(self.records) > 1 and not kw.get('quiet') and self.in_msg == 1:
+			self.records[-1].msgs.append((kw.get('msg') or k[0],))
+
+	def end_msg(self, *k, **kw):
+		"""
+		Records the messages for :py:meth:`waflib.Configure.ConfigurationContext.replay_call`,
+		see :py:meth:`waflib.Context.Context.end_msg`
+		"""
+		super(ConfigurationContext, self).end_msg(*k, **kw)
+		if len(self.records) > 1 and not kw.get('quiet') and not self.in_msg:
+			result = kw.get('result') or k[0]
+			if not (result is True or isinstance(result, str)):
+				result = result and str(result)
+			color = kw.get('color')
+			if not color and len(k) > 1 and k[1] in Logs.colors_lst:
+				color = k[1]
+			self.records[-1].msgs.append((result, color))
+
+	def record_environ(self, var):
+		"""
+		Adds an environment variable to the inputs of the incremental configuration
+
+		:param var: variable name
+		:type var: string
+		"""
+		for x in self.records:
+			x.environ[var] = dict.get(self.environ, var)
+
+	def record_dep(self, path):
+		"""
+		Adds a file or a folder to the inputs of the incremental configuration. The programs found
+		and the *.pc* files read are recorded automatically; the configuration functions reading
+		other files may call this method::
+
+			def configure(conf):
+				conf.record_dep(conf.path.find_node('VERSION').abspath())
+
+		:param path: absolute path
+		:type path: string
+		"""
+		for x in self.records:
+			x.files.add(path)
+
+	def file_sig(self, path):
+		"""
+		Returns a signature for a file or a folder input of the incremental configuration
+
+		:param path: absolute path
+		:type path: string
+		:return: size and modification time, or None if the file does not exist
+		:rtype: tuple
+		"""
+		try:
+			return self.sigs[path]
+		except KeyError:
+			try:
+				st = os.stat(path)
+			except OSError:
+				ret = None
+			else:
+				ret = (st.st_size, st.st_mtime)
+			self.sigs[path] = ret
+			return ret
+
+	def is_unchanged(self, environ, files):
+		"""
+		Compares the inputs recorded by a previous configuration with the current values
+
+		:param environ: environment variable values
+		:type environ: dict
+		:param files: file signatures
+		:type files: dict
+		:rtype: bool
+		"""
+		for (var, val) in environ.items():
+			if dict.get(self.environ, var) != val:
+				return False
+		for (path, sig) in files.items():
+			if self.file_sig(path) != sig:
+				return False
+		return True
+
+	def call_key(self, name, k, kw):
+		"""
+		Computes the key of a configuration test from its arguments and from the contents
+		of ``conf.env``, see :py:meth:`waflib.Configure.ConfigurationContext.replay_call`
+		"""
+		buf = [name, str(self.env)]
+		for v in list(k) + [kw[x] for x in sorted(kw.keys())]:
+			if hasattr(v, '__call__'):
+				buf.append(Utils.h_fun(v))
+			else:
+				buf.append(str(v))
+		buf.extend(sorted(kw.keys()))
+		return Utils.h_list(buf)
+
+	def replay_call(self, f, k, kw):
+		"""
+		Executes a configuration test marked with :py:func:`waflib.Configure.deferrable`. In an incremental
+		configuration (``waf configure --incremental``), the changes made to ``conf.env`` by a test, its
+		return value and its console messages are recorded along with its inputs: the arguments, the contents
+		of ``conf.env`` before the test, the environment variables read and the files used (programs, *.pc* files).
+		The next configuration then replays the results of the tests whose inputs did not change instead
+		of executing them again. The tests that fail are always executed again.
+
+		:param f: configuration function
+		:type f: function
+		:param k: positional arguments, starting with the configuration context
+		:param kw: keyword arguments without *mandatory*
+		"""
+		if len(self.records) != 1:
+			# not an incremental configuration, or a test called by another test
+			return f(*k, **kw)
+
+		key = self.call_key(f.__name__, k[1:], kw)
+		try:
+			(environ, files, ret, table, msgs) = self.previous_calls[key]
+		except KeyError:
+			pass
+		else:
+			if self.is_unchanged(environ, files):
+				self.to_log('incremental: replaying %s from the previous configuration' % f.__name__)
+				self.env.table.clear()
+				self.env.table.update(copy.deepcopy(table))
+				for x in msgs:
+					if len(x) == 1:
+						self.start_msg(x[0])
+					elif x[1]:
+						self.end_msg(x[0], color=x[1])
+					else:
+						self.end_msg(x[0])
+				for x in environ:
+					self.record_environ(x)
+				for x in files:
+					self.record_dep(x)
+				self.calls[key] = self.previous_calls[key]
+				return ret
+
+		rec = conf_record()
+		for x in incremental_environ:
+			rec.environ[x] = dict.get(self.environ, x)
+		self.records.append(rec)
+		try:
+			ret = f(*k, **kw)
+		finally:
+			self.records.pop()
+		self.calls[key] = (rec.environ, rec.files, ret, copy.deepcopy(self.env.get_merged_dict()), rec.msgs)
+		return ret
+
+	def can_replay(self, name, k, kw):
+		"""
+		Returns True if the results of a configuration test queued by :py:meth:`waflib.Configure.ConfigurationContext.defer_checks`
+		can be replayed from the previous configuration
+
+		:rtype: bool
+		"""
+		if len(self.records) != 1:
+			return False
+		kw = dict(kw)
+		kw.pop('mandatory', None)
+		return self.call_key(name, k, kw) in self.previous_calls
+
+	def store_record(self):
+		"""
+		Saves the inputs and the results of the configuration in :py:data:`waflib.Configure.CONF_RECORD`
+		for the next incremental configuration
+		"""
+		rec = self.records[0]
+		for x in incremental_environ:
+			rec.environ[x] = dict.get(self.environ, x)
+
+		calls = {}
+		for (key, (environ, files, ret, table, msgs)) in self.calls.items():
+			if isinstance(files, set):
+				files = dict((x, self.file_sig(x)) for x in files)
+			calls[key] = (environ, files, ret, table, msgs)
+
+		data = {
+			'version': Context.HEXVERSION,
+			'options': self.get_options(),
+			'environ': rec.environ,
+			'files': dict((x, self.file_sig(x)) for x in rec.files),
+			'hash': self.hash,
+			'scripts': self.files,
+			'tools': self.tools,
+			'envs': list(self.all_envs.keys()),
+			'calls': calls,
+			'failed': rec.failed,
+		}
+		path = os.path.join(self.cachedir.abspath(), CONF_RECORD)
+		try:
+			Utils.writef(path, cPickle.dumps(data, Build.PROTOCOL), m='wb')
+		except Exception:
+			# unusual values in conf.env, the next configuration is complete
+			self.to_log('incremental: could not store the configuration inputs %s' % traceback.format_exc())
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+
+	def get_options(self):
+		"""
+		:return: the command-line option values affecting the configuration
+		:rtype: dict
+		"""
+		return dict((k, v) for (k, v) in Options.options.__dict__.items() if not k in incremental_ignore)
+
+	def reuse_configuration(self):
+		"""
+		Loads the inputs and the results of the previous configuration (see :py:meth:`waflib.Configure.ConfigurationContext.store_record`).
+		The configuration is not executed again if the scripts, the command-line options, the environment variables
+		read and the files used did not change; else the results of the unchanged tests are replayed
+		by :py:meth:`waflib.Configure.ConfigurationContext.replay_call`.
+
+		:return: True if the configuration sets of the previous configuration are re-used
+		:rtype: bool
+		"""
+		try:
+			data = cPickle.loads(Utils.readf(os.path.join(self.cachedir.abspath(), CONF_RECORD), m='rb'))
+		except Exception:
+			return False
+		if data.get('version') != Context.HEXVERSION:
+			return False
+		self.previous_calls = data['calls']
+
+		if data['options'] != self.get_options() or not self.is_unchanged(data['environ'], data['files']):
+			return False
+		if data.get('failed', True):
+			# the tests that failed are executed again
+			return False
+
+		h = 0
+		for x in data['scripts']:
+			try:
+				h = Utils.h_list((h, Utils.readf(x, m='rb')))
+			except EnvironmentError:
+				return False
+		if h != data['hash']:
+			return False
+
+		envs = {}
+		for x in data['envs']:
+			try:
+				envs[x] = ConfigSet.ConfigSet(os.path.join(self.cachedir.abspath(), x + Build.CACHE_SUFFIX))
+			except EnvironmentError:
+				return False
+			for y in envs[x][Build.CFG_FILES]:
+				if not os.path.exists(y):
+					return False
+
+		self.all_envs = envs
+		self.tools = data['tools']
+		self.hash = data['hash']
+		self.files = data['scripts']
+		self.msg('Reusing the previous configuration', 'inputs unchanged')
+		return True
+
+	def defer_checks(self):
+		"""
+		Queues the calls to the configuration tests marked with :py:func:`waflib.Configure.deferrable`
+		(``conf.check``, ``conf.check_cfg``, ...) until :py:meth:`waflib.Configure.ConfigurationContext.commit_checks`
+		is called. The queued calls return None, so the results must be read after the commit::
+
+			def configure(conf):
+				conf.defer_checks()
+				conf.check_cfg(package='x11', args='--cflags --libs')
+				conf.check_cfg(package='alsa', args='--cflags --libs', mandatory=False)
+				conf.check(header_name='ladspa.h', mandatory=False)
+				conf.commit_checks()
+				print(conf.env.HAVE_ALSA)
+		"""
+		if self.deferred_checks is None:
+			self.deferred_checks = []
+
+	def commit_checks(self):
+		"""
+		Executes the configuration tests queued since :py:meth:`waflib.Configure.ConfigurationContext.defer_checks`.
+
+		The tests that can be batched into a few compiler invocations (header tests) are first answered by
+		:py:func:`waflib.Tools.c_config.probe_checks`.
+		The other tests are then run concurrently (``waf configure -jN``), each one on a copy of ``conf.env``,
+		and the outputs of their test builds and *-config* programs are kept in
+		:py:attr:`waflib.Configure.ConfigurationContext.check_results`. The tests are then called again
+		in declaration order, and the outputs are re-used for the inputs that did not change. The values
+		in ``conf.env``, the console output and the errors are then the same as for sequential tests;
+		a test depending on the results of a previous one (for example through the defines added)
+		is simply executed again at this point.
+		"""
+		queue = self.deferred_checks
+		self.deferred_checks = None
+		if not queue:
+			return
+
+		tasks = {}
+		try:
+			if len(queue) > 1 and not self.can_replay(*queue[0]):
+				probed = ()
+				probe = getattr(self, 'probe_checks', None)
+				if probe:
+					self.probe_results = {}
+					probed = probe(queue)
+
+				if Options.options.jobs > 1 and len(queue) - len(probed) > 1:
+					self.check_results = {}
+					lst = []
+					bld = deferred_bld(lst)
+					for (i, (name, k, kw)) in enumerate(queue):
+						if i in probed:
+							continue
+						tsk = deferred_check(bld=bld, env=None)
+						tsk.bld = bld
+						tsk.conf = self
+						tsk.fun = name
+						tsk.k = k
+						tsk.kw = kw
+						tsk.logger = Logs.make_mem_logger(str(id(tsk)), self.logger)
+						tasks[i] = tsk
+						lst.append(tsk)
+
+					def it():
+						yield lst
+						while 1:
+							yield []
+					bld.producer = p = Runner.Parallel(bld, Options.options.jobs)
+					p.biter = it()
+					p.start()
+
+			for (i, (name, k, kw)) in enumerate(queue):
+				if i in tasks:
+					# the commands executed by the test are logged before its result
+					tasks[i].logger.memhandler.flush()
+				getattr(self, name)(*k, **kw)
+		finally:
+			self.check_results = None
+			self.probe_results = None
+			for x in tasks.values():
+				Logs.free_logger(x.logger)
+
+class deferred_bld(object):
+	"""
+	Build context substitute for executing deferred configuration tests through
+	:py:class:`waflib.Runner.Parallel`
+	"""
+	def __init__(self, tasks):
+		self.tasks = tasks
+		self.keep = True
+		self.progress_bar = 0
+		self.is_install = 0
+		self.task_sigs = {}
+		self.imp_sigs = {}
+		self.node_deps = {}
+		self.task_times = {}
+		self.task_rss = {}
+
+	def total(self):
+		return len(self.tasks)
+
+class deferred_check(Task.Task):
+	"""
+	Runs a configuration test queued by :py:meth:`waflib.Configure.ConfigurationContext.defer_checks`
+	on a copy of ``conf.env``; the errors are raised when the test is called again in declaration order
+	"""
+	def display(self):
+		return ''
+
+	def runnable_status(self):
+		return Task.RUN_ME
+
+	def uid(self):
+		return Utils.SIG_NIL
+
+	def signature(self):
+		return Utils.SIG_NIL
+
+	def run(self):
+		conf = self.conf
+		bld = Build.BuildContext(top_dir=conf.srcnode.abspath(), out_dir=conf.bldnode.abspath())
+		bld.env = conf.env.derive().detach()
+		bld.init_dirs()
+		bld.in_msg = 1 # suppress top-level start_msg
+		bld.logger = self.logger
+		bld.check_results = conf.check_results
+		# share the *-config outputs, see waflib.Tools.c_config.get_cfg_cache
+		bld.conf = conf
+		try:
+			getattr(bld, self.fun)(*self.k, **self.kw)
+		except Exception:
+			pass
+
 def conf(f):
 	"""
 	Decorator: attach new configuration functions to :py:class:`waflib.Build.BuildContext` and
@@ -312,10 +801,20 @@ def conf(f):
 	:type f: function
 	"""
 	def fun(*k, **kw):
+		queue = getattr(k[0], 'deferred_checks', None)
+		if queue is not None and getattr(f, 'deferrable', False):
+			queue.append((f.__name__, k[1:], kw))
+			return None
 		mandatory = kw.pop('mandatory', True)
 		try:
+			if getattr(f, 'deferrable', False) and hasattr(k[0], 'replay_call'):
+				return k[0].replay_call(f, k, kw)
 			return f(*k, **kw)
 		except Errors.ConfigurationError:
+			records = getattr(k[0], 'records', None)
+			if records:
+				# an incremental configuration cannot be re-used as a whole
+				records[0].failed = True
 			if mandatory:
 				raise
 
@@ -324,6 +823,25 @@ def conf(f):
 	setattr(Build.BuildContext, f.__name__, fun)
 	return f
 
+def deferrable(f):
+	"""
+	Decorator: allow the calls to a configuration function to be queued by
+	:py:meth:`waflib.Configure.ConfigurationContext.defer_checks`. The function must
+	only change ``conf.env``: it is executed twice when the tests run in parallel, and its results
+	are replayed by :py:meth:`waflib.Configure.ConfigurationContext.replay_call` in incremental
+	configurations::
+
+		@conf
+		@deferrable
+		def check_foo(self, **kw):
+			...
+
+	:param f: method to mark
+	:type f: function
+	"""
+	f.deferrable = True
+	return f
+
 @conf
 def add_os_flags(self, var, dest=None, dup=False):
 	"""
@@ -477,6 +995,15 @@ def find_program(self, filename, **kw):
 	if not kw.get('quiet'):
 		self.to_log('find program=%r paths=%r var=%r -> %r' % (filename, path_list, var, ret))
 
+	record_dep = get_record_dep(self)
+	if record_dep:
+		# a program added or upgraded invalidates incremental configurations
+		for x in path_list:
+			if os.path.isabs(x):
+				record_dep(x)
+		if ret and os.path.isabs(ret[0]):
+			record_dep(ret[0])
+
 	if not ret:
 		self.fatal(kw.get('errmsg', '') or 'Could not find the program %r' % filename)
 
@@ -505,6 +1032,123 @@ def find_binary(self, filenames, exts, paths):
 						return x
 	return None
 
+def get_user_cache():
+	"""
+	Returns the folder of the user-level cache of configuration tests, see :py:attr:`waflib.Configure.user_cache`
+
+	:rtype: string
+	"""
+	if user_cache == '1':
+		base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+		return os.path.join(base, 'waf', 'conf')
+	return os.path.abspath(os.path.expanduser(user_cache))
+
+def user_cache_key(kw, inputs=()):
+	"""
+	Computes the key of a configuration test in the user-level cache. Unlike the folder
+	names computed by :py:func:`waflib.Configure.run_build`, only the variables used by
+	the tasks of the test build are considered, so that the results may be shared by
+	different projects and build directories. The size and the modification time of the
+	programs (compilers) found in those variables, and of the include and library folders
+	of the test, are also hashed. Tests using relative folders are not shared.
+
+	:param kw: parameters of :py:func:`waflib.Configure.run_build`
+	:type kw: dict
+	:param inputs: other files and folders the result depends on, see :py:func:`waflib.Tools.c_config.get_test_inputs`
+	:type inputs: list of string
+	:return: the key, or None if the result must not be shared
+	:rtype: bytes
+	"""
+	from waflib.Tools import ccroot
+	env = kw['env']
+
+	dirs = get_test_dirs(kw, ('INCLUDES', 'LIBPATH', 'STLIBPATH'), relative=True)
+	for x in dirs:
+		if not os.path.isabs(x):
+			return None
+
+	names = set()
+	for x in Utils.to_list(kw.get('features', [])):
+		names.update(ccroot.USELIB_VARS.get(x, ()))
+		cls = Task.classes.get(x)
+		if cls:
+			names.update(cls.vars)
+	if names:
+		# variables of the uselib names, see waflib.Tools.ccroot.propagate_uselib_vars
+		for x in Utils.to_list(kw.get('use', [])) + Utils.to_list(kw.get('uselib', [])):
+			names.update(['%s_%s' % (var, x) for var in list(names)])
+	else:
+		# custom build function
+		names = env.keys()
+
+	buf = [Context.HEXVERSION]
+	for key in sorted(kw.keys()):
+		v = kw[key]
+		if key == 'env':
+			continue
+		if hasattr(v, '__call__'):
+			buf.append(Utils.h_fun(v))
+		else:
+			buf.append(str(v))
+	for x in sorted(names):
+		val = env[x]
+		buf.append((x, val))
+		if isinstance(val, list) and val and os.path.isabs(str(val[0])):
+			try:
+				st = os.stat(val[0])
+			except OSError:
+				pass
+			else:
+				buf.append((st.st_size, st.st_mtime))
+	for x in dirs + [y for y in inputs if not y in dirs]:
+		try:
+			st = os.stat(x)
+		except OSError:
+			buf.append((x, None))
+		else:
+			buf.append((x, st.st_size, st.st_mtime))
+	return Utils.h_list(buf)
+
+def get_record_dep(ctx):
+	"""
+	Returns the method recording the inputs of an incremental configuration, see
+	:py:meth:`waflib.Configure.ConfigurationContext.record_dep`
+
+	:param ctx: configuration context, or the build context of a parallel test
+	:return: the method, or None if the inputs are not being recorded
+	"""
+	if getattr(ctx, 'records', None):
+		return ctx.record_dep
+	return None
+
+def get_test_dirs(kw, names, relative=False):
+	"""
+	Returns the absolute folders given to a configuration test through the parameters
+	and the variables *names* (for example ``includes`` and ``INCLUDES``), including the ones
+	of the *use* and *uselib* names
+
+	:param kw: parameters of :py:func:`waflib.Configure.run_build`
+	:type kw: dict
+	:param names: variable names
+	:type names: list of string
+	:param relative: return the relative folders too
+	:type relative: bool
+	:rtype: list of string
+	"""
+	env = kw['env']
+	uselib = Utils.to_list(kw.get('use', [])) + Utils.to_list(kw.get('uselib', []))
+	ret = []
+	for var in names:
+		lst = Utils.to_list(kw.get(var.lower(), [])) + Utils.to_list(env[var])
+		for x in uselib:
+			lst += Utils.to_list(env['%s_%s' % (var, x)])
+		for x in lst:
+			if not isinstance(x, str):
+				x = x.abspath()
+			if (relative or os.path.isabs(x)) and not x in ret:
+				ret.append(x)
+	return ret
+
 @conf
 def run_build(self, *k, **kw):
 	"""
@@ -534,6 +1178,12 @@ def run_build(self, *k, **kw):
 
 		$ waf configure --confcache
 
+	The results of the successful tests may also be shared by the projects and the build
+	directories of the current user by setting :py:attr:`waflib.Configure.user_cache`,
+	for example through the environment::
+
+		$ WAF_CONF_CACHE=1 waf configure
+
 	"""
 	buf = []
 	for key in sorted(kw.keys()):
@@ -545,6 +1195,40 @@ def run_build(self, *k, **kw):
 	h = Utils.h_list(buf)
 	dir = self.bldnode.abspath() + os.sep + (not Utils.is_win32 and '.' or '') + 'conf_check_' + Utils.to_hex(h)
 
+	record_dep = get_record_dep(self)
+	if record_dep:
+		for x in ('CC', 'CXX', 'LINK_CC', 'LINK_CXX'):
+			if self.env[x] and os.path.isabs(self.env[x][0]):
+				record_dep(self.env[x][0])
+		# headers and libraries added or removed
+		for x in get_test_dirs(kw, ('INCLUDES', 'LIBPATH', 'STLIBPATH')):
+			record_dep(x)
+
+	# tests executed by ConfigurationContext.commit_checks
+	results = getattr(self, 'check_results', None)
+	if results is not None and h in results:
+		ret = results[h]
+		if isinstance(ret, str) and ret.startswith('Test does not build'):
+			self.fatal(ret)
+		return ret
+
+	ucache = None
+	if user_cache:
+		inputs = getattr(self, 'get_test_inputs', None)
+		key = user_cache_key(kw, inputs and inputs(kw) or ())
+		if key:
+			ucache = os.path.join(get_user_cache(), Utils.to_hex(key))
+			try:
+				proj = ConfigSet.ConfigSet(ucache)
+			except EnvironmentError:
+				pass
+			else:
+				self.to_log('using the cached test result %s' % ucache)
+				ret = proj['cache_run_build']
+				if results is not None:
+					results[h] = ret
+				return ret
+
 	cachemode = kw.get('confcache', getattr(Options.options, 'confcache', None))
 
 	if not cachemode and os.path.exists(dir):
@@ -595,9 +1279,24 @@ def run_build(self, *k, **kw):
 			bld.compile()
 		except Errors.WafError:
 			ret = 'Test does not build: %s' % traceback.format_exc()
+			if results is not None:
+				results[h] = ret
 			self.fatal(ret)
 		else:
 			ret = getattr(bld, 'retval', 0)
+			if results is not None:
+				results[h] = ret
+			if ucache:
+				# only the successful tests are kept as the missing packages may be installed later
+				proj = ConfigSet.ConfigSet()
+				proj['cache_run_build'] = ret
+				tmp = '%s.%x.tmp' % (ucache, id(bld))
+				try:
+					proj.store(tmp)
+					# do not use shutil.move (copy is not thread-safe)
+					os.rename(tmp, ucache)
+				except OSError:
+					pass
 	finally:
 		if cachemode:
 			# cache the results each time
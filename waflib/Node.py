@@ -21,7 +21,7 @@ Node: filesystem structure
    owning a node is held as *self.ctx*
 """
 
-import os, re, sys, shutil
+import os, re, sys, shutil, stat, struct, time
 from waflib import Utils, Errors
 
 exclude_regs = '''
@@ -61,6 +61,13 @@ Ant patterns for files and folders to exclude while doing the
 recursive traversal in :py:meth:`waflib.Node.Node.ant_glob`
 """
 
+STAT_SLACK = 2
+"""
+Files modified less than this amount of seconds before being hashed are not recorded in the
+persistent hash cache, since a change within the same timestamp granule would not be noticed
+(see :py:meth:`waflib.Node.Node.h_file_stat`)
+"""
+
 def ant_matcher(s, ignorecase):
 	reflags = re.I if ignorecase else 0
 	ret = []
@@ -931,9 +938,49 @@ class Node(object):
 		"""
 		return Utils.h_file(self.abspath())
 
+	def h_file_stat(self):
+		"""
+		Returns the hash of the file contents like :py:meth:`waflib.Node.Node.h_file`, reusing the
+		hash stored in :py:attr:`waflib.Build.BuildContext.file_sigs` by a previous build when the
+		size, the modification time and the inode of the file are unchanged. The contents are hashed
+		again on any mismatch; recently modified files are not recorded (see :py:const:`waflib.Node.STAT_SLACK`).
+		The entries of the files that are not used anymore are removed when the build data is stored
+		(see :py:meth:`waflib.Build.BuildContext.evict_file_sigs`).
+
+		:return: a hash representing the file contents
+		:rtype: string or bytes
+		"""
+		try:
+			cache = self.ctx.file_sigs
+		except AttributeError:
+			return self.h_file()
+
+		st = os.stat(self.abspath())
+		if not stat.S_ISREG(st.st_mode):
+			return self.h_file()
+		try:
+			self.ctx.file_sigs_used.add(self)
+		except AttributeError:
+			pass
+		key = (st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime), st.st_ino)
+		try:
+			entry = cache[self]
+		except KeyError:
+			pass
+		else:
+			if entry[0] == key:
+				return entry[1]
+
+		ret = self.h_file()
+		if time.time() - st.st_mtime > STAT_SLACK:
+			cache[self] = (key, ret)
+		elif self in cache:
+			del cache[self]
+		return ret
+
 	def get_bld_sig(self):
 		"""
-		Returns a signature (see :py:meth:`waflib.Node.Node.h_file`) for the purpose
+		Returns a signature (see :py:meth:`waflib.Node.Node.h_file_stat`) for the purpose
 		of build dependency calculation. This method uses a per-context cache.
 
 		:return: a hash representing the object contents
@@ -949,7 +996,7 @@ class Node(object):
 		except KeyError:
 			p = self.abspath()
 			try:
-				ret = cache[self] = self.h_file()
+				ret = cache[self] = self.h_file_stat()
 			except EnvironmentError:
 				if self.isdir():
 					# allow folders as build nodes, do not use the creation time
@@ -959,6 +1006,365 @@ class Node(object):
 				raise
 		return ret
 
+if sys.hexversion > 0x3000000:
+	def encode_name(name):
+		"""Converts a node name to the bytes stored in a :py:class:`waflib.Node.NodeTable`"""
+		return name.encode('utf-8', 'surrogateescape')
+	def decode_name(raw):
+		"""Converts the bytes stored in a :py:class:`waflib.Node.NodeTable` to a node name"""
+		return raw.decode('utf-8', 'surrogateescape')
+else:
+	encode_name = decode_name = str
+
+def pack_ids(lst):
+	"""
+	Packs a list of node identifiers as little-endian 32-bit integers
+
+	:param lst: node identifiers
+	:type lst: list of int
+	:rtype: bytes
+	"""
+	return struct.pack('<%di' % len(lst), *lst)
+
+class node_ids(bytes):
+	"""
+	List of nodes stored in the build cache file as identifiers of a :py:class:`waflib.Node.NodeTable`,
+	see :py:meth:`waflib.Node.NodeTable.decode`
+	"""
+	__slots__ = ()
+	def __reduce__(self):
+		return (node_ids, (bytes(self),))
+
+class lazy_children(dict):
+	"""
+	Children of a node restored from a :py:class:`waflib.Node.NodeTable`. The child nodes
+	are created when their names are looked up; iterating over the dict creates all of them.
+	"""
+	__slots__ = ('table', 'nid', 'owner', 'removed')
+	def __init__(self, table, nid, owner):
+		dict.__init__(self)
+		self.table = table
+		self.nid = nid
+		self.owner = owner
+		self.removed = set()
+	def __missing__(self, name):
+		if name in self.removed:
+			raise KeyError(name)
+		nid = self.table.find_child(self.nid, name)
+		if nid < 0:
+			raise KeyError(name)
+		return self.table.make(nid, name, self.owner)
+	def __contains__(self, name):
+		if dict.__contains__(self, name):
+			return True
+		return not name in self.removed and self.table.find_child(self.nid, name) >= 0
+	def __setitem__(self, name, node):
+		dict.__setitem__(self, name, node)
+		self.removed.discard(name)
+	def __delitem__(self, name):
+		if dict.__contains__(self, name):
+			dict.__delitem__(self, name)
+		elif not name in self:
+			raise KeyError(name)
+		self.removed.add(name)
+	def get(self, name, default=None):
+		try:
+			return self[name]
+		except KeyError:
+			return default
+	def pop(self, name, *k):
+		try:
+			node = self[name]
+		except KeyError:
+			if k:
+				return k[0]
+			raise
+		del self[name]
+		return node
+	def popitem(self):
+		self.load()
+		ret = dict.popitem(self)
+		self.removed.add(ret[0])
+		return ret
+	def setdefault(self, name, default=None):
+		try:
+			return self[name]
+		except KeyError:
+			self[name] = default
+			return default
+	def update(self, *k, **kw):
+		for name, node in dict(*k, **kw).items():
+			self[name] = node
+	def clear(self):
+		table = self.table
+		self.removed.update(decode_name(table.raw_name(nid)) for nid in table.child_range(self.nid))
+		dict.clear(self)
+	def copy(self):
+		self.load()
+		return dict(self)
+	def __reduce__(self):
+		self.load()
+		return (dict, (dict(self),))
+	def load(self):
+		"""Creates the child nodes that were not looked up yet"""
+		table = self.table
+		for nid in table.child_range(self.nid):
+			name = decode_name(table.raw_name(nid))
+			if not dict.__contains__(self, name) and not name in self.removed:
+				table.make(nid, name, self.owner)
+	def keys(self):
+		self.load()
+		return dict.keys(self)
+	def values(self):
+		self.load()
+		return dict.values(self)
+	def items(self):
+		self.load()
+		return dict.items(self)
+	def __iter__(self):
+		self.load()
+		return dict.__iter__(self)
+	def __len__(self):
+		self.load()
+		return dict.__len__(self)
+
+class NodeTable(object):
+	"""
+	Read-only view of a node tree written by :py:meth:`waflib.Node.NodeTable.dump`, typically
+	memory-mapped from the build cache file. Nodes are stored in breadth-first order, and the children
+	of a node are stored contiguously and sorted by name, so that a child is found by binary search
+	without reading the rest of the tree. Node objects are only created for the identifiers and names that are
+	looked up (see :py:class:`waflib.Node.lazy_children`).
+
+	The layout is a header (magic, node count, size of the names) followed by four arrays of
+	little-endian 32-bit integers (parent, first child, amount of children, name offsets) and the names.
+	"""
+
+	MAGIC = b'wafnode1'
+	header = struct.Struct('<8sII')
+	integer = struct.Struct('<i')
+	pair = struct.Struct('<ii')
+
+	def __init__(self, data, offset=0):
+		magic, count, names_size = self.header.unpack_from(data, offset)
+		if magic != self.MAGIC:
+			raise ValueError('Invalid node table')
+		pos = offset + self.header.size
+		self.count = count
+		self.parents = pos
+		self.firsts = pos + 4 * count
+		self.sizes = pos + 8 * count
+		self.offsets = pos + 12 * count
+		self.names = pos + 16 * count + 4
+		self.end = self.names + names_size
+		if self.end > len(data):
+			raise ValueError('Truncated node table')
+		self.data = data
+
+		self.nodes = {}
+		"""Nodes created so far, by identifier"""
+		self.ids = {}
+		"""Identifiers of the nodes created so far"""
+
+	def parent(self, nid):
+		"Identifier of the parent node"
+		return self.integer.unpack_from(self.data, self.parents + 4 * nid)[0]
+
+	def child_range(self, nid):
+		"Identifiers of the children of a node"
+		first = self.integer.unpack_from(self.data, self.firsts + 4 * nid)[0]
+		return range(first, first + self.integer.unpack_from(self.data, self.sizes + 4 * nid)[0])
+
+	def raw_name(self, nid):
+		"Name of a node, as bytes"
+		start, end = self.pair.unpack_from(self.data, self.offsets + 4 * nid)
+		return self.data[self.names + start:self.names + end]
+
+	def find_child(self, nid, name):
+		"""
+		Finds a child by name
+
+		:param nid: identifier of the parent node
+		:type nid: int
+		:param name: name of the child
+		:type name: string
+		:return: identifier of the child or -1
+		:rtype: int
+		"""
+		raw = encode_name(name)
+		rng = self.child_range(nid)
+		lo = rng[0] if rng else 0
+		hi = lo + len(rng)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			cur = self.raw_name(mid)
+			if cur < raw:
+				lo = mid + 1
+			elif cur > raw:
+				hi = mid
+			else:
+				return mid
+		return -1
+
+	def attach(self, root):
+		"""
+		Binds the table to the node tree of a context. The nodes created before the table was
+		loaded (the run directory for example) are bound to their identifiers, and their
+		children are looked up in the table from then on.
+
+		:param root: root node
+		:type root: :py:class:`waflib.Node.Node`
+		"""
+		stack = [(root, 0)]
+		while stack:
+			node, nid = stack.pop()
+			self.nodes[nid] = node
+			self.ids[node] = nid
+			old = getattr(node, 'children', None)
+			if isinstance(old, lazy_children) or not self.child_range(nid):
+				continue
+			children = lazy_children(self, nid, node)
+			if old:
+				for name, child in old.items():
+					dict.__setitem__(children, name, child)
+					cnid = self.find_child(nid, name)
+					if cnid >= 0:
+						stack.append((child, cnid))
+			node.children = children
+
+	def make(self, nid, name, parent):
+		"""
+		Creates the node object for an identifier, see :py:class:`waflib.Node.lazy_children`
+
+		:rtype: :py:class:`waflib.Node.Node`
+		"""
+		# the constructor would find the name in the table
+		node = parent.__class__.__new__(parent.__class__)
+		node.name = name
+		node.parent = parent
+		dict.__setitem__(parent.children, name, node)
+		if self.child_range(nid):
+			node.children = lazy_children(self, nid, node)
+		self.nodes[nid] = node
+		self.ids[node] = nid
+		return node
+
+	def node(self, nid):
+		"""
+		Returns the node object for an identifier, creating it and its parents if necessary
+
+		:param nid: node identifier
+		:type nid: int
+		:rtype: :py:class:`waflib.Node.Node`
+		"""
+		try:
+			return self.nodes[nid]
+		except KeyError:
+			pass
+		parent = self.node(self.parent(nid))
+		name = decode_name(self.raw_name(nid))
+		try:
+			node = parent.children[name]
+		except (AttributeError, KeyError):
+			node = parent.make_node([name])
+		self.nodes[nid] = node
+		self.ids[node] = nid
+		return node
+
+	def find_id(self, node):
+		"""
+		Returns the identifier of a node; the path of the node is looked up in the table
+		if the node object was not bound to the table
+
+		:param node: node
+		:type node: :py:class:`waflib.Node.Node`
+		:return: node identifier or -1
+		:rtype: int
+		"""
+		try:
+			return self.ids[node]
+		except KeyError:
+			pass
+		if node.parent is None:
+			return -1
+		nid = self.find_id(node.parent)
+		if nid < 0:
+			return -1
+		return self.find_child(nid, node.name)
+
+	def decode(self, val):
+		"""
+		Converts a list of node identifiers (:py:class:`waflib.Node.node_ids`) to a list of nodes;
+		other values are returned unchanged
+
+		:rtype: list of :py:class:`waflib.Node.Node`
+		"""
+		if isinstance(val, node_ids):
+			return [self.node(nid) for nid in struct.unpack('<%di' % (len(val) // 4), val)]
+		return val
+
+	@classmethod
+	def dump(cls, root, old=None):
+		"""
+		Serializes the node tree. The parts of the previous table that were never
+		looked up are copied without creating node objects.
+
+		:param root: root node
+		:type root: :py:class:`waflib.Node.Node`
+		:param old: table the node tree was restored from, if any
+		:type old: :py:class:`waflib.Node.NodeTable`
+		:return: the serialized table, a dict mapping the nodes to their new identifiers,
+		  and a dict mapping the identifiers of the previous table to the new identifiers
+		:rtype: tuple
+		"""
+		# (node or None, identifier in the previous table or -1, name as bytes)
+		entries = [(root, old.ids.get(root, -1) if old else -1, b'')]
+		parents = [-1]
+		firsts = []
+		sizes = []
+		ids = {}
+		remap = {}
+		idx = 0
+		while idx < len(entries):
+			node, onid, raw = entries[idx]
+			children = {}
+			if node is None:
+				for cnid in old.child_range(onid):
+					craw = old.raw_name(cnid)
+					children[craw] = (None, cnid, craw)
+			else:
+				ids[node] = idx
+				ch = getattr(node, 'children', None)
+				if isinstance(ch, lazy_children) and ch.table is old:
+					for cnid in old.child_range(ch.nid):
+						craw = old.raw_name(cnid)
+						if not decode_name(craw) in ch.removed:
+							children[craw] = (None, cnid, craw)
+				if ch is not None:
+					# the children that were not looked up are copied from the table above
+					for name, child in dict.items(ch):
+						craw = encode_name(name)
+						children[craw] = (child, old.ids.get(child, -1) if old else -1, craw)
+			if onid >= 0:
+				remap[onid] = idx
+
+			firsts.append(len(entries))
+			sizes.append(len(children))
+			for craw in sorted(children):
+				entries.append(children[craw])
+				parents.append(idx)
+			idx += 1
+
+		offsets = [0]
+		for entry in entries:
+			offsets.append(offsets[-1] + len(entry[2]))
+		names = b''.join(entry[2] for entry in entries)
+		data = b''.join((
+			cls.header.pack(cls.MAGIC, len(entries), len(names)),
+			pack_ids(parents), pack_ids(firsts), pack_ids(sizes), pack_ids(offsets),
+			names))
+		return (data, ids, remap)
+
 pickle_lock = Utils.threading.Lock()
 """Lock mandatory for thread-safe node serialization"""
 
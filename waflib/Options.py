@@ -141,6 +141,12 @@ class OptionsContext(Context.Context):
 		gr.add_option('-o', '--out', action='store', default='', help='build dir for the project', dest='out')
 		gr.add_option('-t', '--top', action='store', default='', help='src dir for the project', dest='top')
 
+		gr.add_option('--signature-hash', action='store', default=os.environ.get('WAF_SIG_HASH', ''), dest='sig_hash',
+			help='hash algorithm for the build signatures, one of %s [default: md5]' % ', '.join(sorted(Utils.SIG_HASHES)))
+
+		gr.add_option('--incremental', action='store_true', default=bool(os.environ.get('WAF_INCREMENTAL', '')), dest='incremental',
+			help='replay the configuration tests whose inputs did not change since the previous configuration')
+
 		gr.add_option('--no-lock-in-run', action='store_true', default='', help=optparse.SUPPRESS_HELP, dest='no_lock_in_run')
 		gr.add_option('--no-lock-in-out', action='store_true', default='', help=optparse.SUPPRESS_HELP, dest='no_lock_in_out')
 		gr.add_option('--no-lock-in-top', action='store_true', default='', help=optparse.SUPPRESS_HELP, dest='no_lock_in_top')
@@ -161,6 +167,8 @@ class OptionsContext(Context.Context):
 		self.option_groups['build and install options'] = gr
 		gr.add_option('-p', '--progress', dest='progress_bar', default=0, action='count', help= '-p: progress bar; -pp: ide output')
 		gr.add_option('--targets',        dest='targets', default='', action='store', help='task generators, e.g. "target1,target2"')
+		gr.add_option('--memory-budget',  dest='memory_budget', default=int(os.environ.get('WAF_MEMORY_BUDGET', 0)), type='int',
+			help='memory in MB that parallel tasks may use, based on previous builds [default: 0, no limit]')
 
 		gr = self.add_option_group('Step options')
 		self.option_groups['step options'] = gr
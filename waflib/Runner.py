@@ -6,7 +6,13 @@
 Runner.py: Task scheduling and execution
 """
 
-import heapq, traceback
+import heapq, os, traceback
+from array import array
+from collections import deque
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
 try:
 	from queue import Queue, PriorityQueue
 except ImportError:
@@ -30,6 +36,59 @@ GAP = 5
 Wait for at least ``GAP * njobs`` before trying to enqueue more tasks to run
 """
 
+HASH_MIN = 32
+"""
+Minimum amount of files for hashing the files of a build group in threads, see :py:meth:`waflib.Runner.Parallel.hash_group`
+"""
+
+SCAN_MIN = 8
+"""
+Minimum amount of tasks to scan in each process, see :py:meth:`waflib.Runner.Parallel.scan_group`
+"""
+
+scan_tasks = []
+"""
+Tasks to scan, inherited by the processes forked by :py:meth:`waflib.Runner.Parallel.scan_group`
+"""
+
+scan_ids = {}
+"""
+Identifiers of the paths returned by :py:func:`waflib.Runner.scan_task` in a forked process
+"""
+
+def scan_task(idx):
+	"""
+	Runs the scanner of a task in a process forked by :py:meth:`waflib.Runner.Parallel.scan_group`.
+	A process returns each path once, the nodes are then given by the indexes of their paths
+	among all the paths returned by the process.
+
+	:param idx: index of the task in *scan_tasks*
+	:type idx: int
+	:return: the task index, the process id, the paths returned for the first time, the path indexes
+		(an array of integers as bytes), the unresolved names and the data returned by the ``process_export``
+		function of the scanner; or the task index alone if the scanner failed
+	:rtype: tuple
+	"""
+	tsk = scan_tasks[idx]
+	try:
+		(nodes, names) = tsk.scan()
+		paths = [x.abspath() for x in nodes]
+		export = getattr(tsk.scan, 'process_export', None)
+		data = export and export(tsk.generator.bld)
+	except Exception:
+		return (idx,)
+
+	new = []
+	ids = array('I')
+	for x in paths:
+		try:
+			ids.append(scan_ids[x])
+		except KeyError:
+			scan_ids[x] = len(scan_ids)
+			ids.append(scan_ids[x])
+			new.append(x)
+	return (idx, os.getpid(), new, ids.tobytes(), names, data)
+
 class PriorityTasks(object):
 	def __init__(self):
 		self.lst = []
@@ -59,50 +118,78 @@ class PriorityTasks(object):
 			else:
 				self.lst = lst.lst
 
-class Consumer(Utils.threading.Thread):
+class ResultQueue(object):
 	"""
-	Daemon thread object that executes a task. It shares a semaphore with
-	the coordinator :py:class:`waflib.Runner.Spawner`. There is one
-	instance per task to consume.
+	Queue of the tasks executed by the consumers. Consumers append tasks without
+	taking a lock unless the producer is waiting, and the producer collects all
+	the tasks available at once with :py:meth:`waflib.Runner.ResultQueue.get_all`.
 	"""
-	def __init__(self, spawner, task):
-		Utils.threading.Thread.__init__(self)
-		self.task = task
-		"""Task to execute"""
-		self.spawner = spawner
-		"""Coordinator object"""
-		self.setDaemon(1)
-		self.start()
-	def run(self):
+	def __init__(self):
+		self.items = deque()
+		self.cond = Utils.threading.Condition(Utils.threading.Lock())
+		self.waiting = False
+	def __len__(self):
+		return len(self.items)
+	def put(self, tsk):
 		"""
-		Processes a single task
+		Adds an executed task, and wakes up the producer if it is waiting
+
+		:param tsk: task instance
+		:type tsk: :py:class:`waflib.Task.Task`
 		"""
+		self.items.append(tsk)
+		# the producer sets the flag before looking at the items, so a notification cannot be missed
+		if self.waiting:
+			with self.cond:
+				self.cond.notify()
+	def get_all(self):
+		"""
+		Waits until at least one task is available, and returns all the tasks available
+
+		:rtype: list of :py:class:`waflib.Task.Task`
+		"""
+		items = self.items
+		if not items:
+			with self.cond:
+				self.waiting = True
+				while not items:
+					self.cond.wait()
+				self.waiting = False
+		lst = []
 		try:
-			if not self.spawner.master.stop:
-				self.spawner.master.process_task(self.task)
-		finally:
-			self.spawner.sem.release()
-			self.spawner.master.out.put(self.task)
-			self.task = None
-			self.spawner = None
+			while 1:
+				lst.append(items.popleft())
+		except IndexError:
+			pass
+		return lst
 
-class Spawner(Utils.threading.Thread):
+class StopConsumer(object):
 	"""
-	Daemon thread that consumes tasks from :py:class:`waflib.Runner.Parallel` producer and
-	spawns a consuming thread :py:class:`waflib.Runner.Consumer` for each
-	:py:class:`waflib.Task.Task` instance.
+	Marker added to :py:attr:`waflib.Runner.Parallel.ready` to terminate the consumers.
+	Its priority is lower than the priority of any task.
 	"""
-	def __init__(self, master):
+	def priority(self):
+		return (float('-inf'), 0)
+	def __lt__(self, other):
+		return False
+	def __gt__(self, other):
+		return True
+
+class Consumer(Utils.threading.Thread):
+	"""
+	Daemon thread object that executes tasks from the ready queue of
+	the producer until a :py:class:`waflib.Runner.StopConsumer` is obtained.
+	The coordinator :py:class:`waflib.Runner.Spawner` creates one instance per job.
+	"""
+	def __init__(self, spawner):
 		Utils.threading.Thread.__init__(self)
-		self.master = master
-		""":py:class:`waflib.Runner.Parallel` producer instance"""
-		self.sem = Utils.threading.Semaphore(master.numjobs)
-		"""Bounded semaphore that prevents spawning more than *n* concurrent consumers"""
+		self.spawner = spawner
+		"""Coordinator object"""
 		self.setDaemon(1)
 		self.start()
 	def run(self):
 		"""
-		Spawns new consumers to execute tasks by delegating to :py:meth:`waflib.Runner.Spawner.loop`
+		Processes tasks until the producer has no more tasks to provide
 		"""
 		try:
 			self.loop()
@@ -110,18 +197,61 @@ class Spawner(Utils.threading.Thread):
 			# Python 2 prints unnecessary messages when shutting down
 			# we also want to stop the thread properly
 			pass
+		finally:
+			self.spawner = None
 	def loop(self):
 		"""
-		Consumes task objects from the producer; ends when the producer has no more
-		task to provide.
+		Consumes task objects from the producer, and returns them through :py:attr:`waflib.Runner.Parallel.out`
 		"""
-		master = self.master
+		master = self.spawner.master
 		while 1:
 			task = master.ready.get()
-			self.sem.acquire()
-			if not master.stop:
-				task.log_display(task.generator.bld)
-			Consumer(self, task)
+			if isinstance(task, StopConsumer):
+				break
+			try:
+				if not master.stop:
+					task.log_display(task.generator.bld)
+					master.process_task(task)
+			except Exception:
+				# keep the consumer alive for the next tasks
+				task.err_msg = traceback.format_exc()
+				task.hasrun = Task.EXCEPTION
+				master.error_handler(task)
+			finally:
+				master.out.put(task)
+
+class Spawner(object):
+	"""
+	Pool of :py:class:`waflib.Runner.Consumer` threads executing the tasks
+	provided by the :py:class:`waflib.Runner.Parallel` producer. The pool size
+	is the amount of jobs, and the threads are reused for all the tasks of a build.
+	The threads are created when the first task is enqueued.
+	"""
+	def __init__(self, master):
+		self.master = master
+		""":py:class:`waflib.Runner.Parallel` producer instance"""
+		self.consumers = []
+		"""Consumer threads"""
+	def start(self):
+		"""
+		Creates the consumers if they are not running
+		"""
+		if not self.consumers:
+			self.consumers = [Consumer(self) for x in range(self.master.numjobs)]
+	def stop(self, join=False):
+		"""
+		Terminates the consumers once the tasks in the ready queue are processed
+
+		:param join: wait for the threads to terminate
+		:type join: bool
+		"""
+		consumers = self.consumers
+		for x in consumers:
+			self.master.ready.put(StopConsumer())
+		self.consumers = []
+		if join:
+			for x in consumers:
+				x.join()
 
 class Parallel(object):
 	"""
@@ -155,7 +285,7 @@ class Parallel(object):
 		self.ready = PriorityQueue(0)
 		"""List of :py:class:`waflib.Task.Task` ready to be executed by consumers"""
 
-		self.out = Queue(0)
+		self.out = ResultQueue()
 		"""List of :py:class:`waflib.Task.Task` returned by the task consumers"""
 
 		self.count = 0
@@ -183,12 +313,20 @@ class Parallel(object):
 		The reverse dependency graph of dependencies obtained from Task.run_after
 		"""
 
+		self.memory = None
+		"""
+		Weighted semaphore (in kilobytes) used to keep the predicted memory usage
+		of the running tasks below :py:attr:`waflib.Build.BuildContext.memory_budget`
+		"""
+
 		self.spawner = None
 		"""
 		Coordinating daemon thread that spawns thread consumers
 		"""
 		if self.numjobs > 1:
 			self.spawner = Spawner(self)
+			if getattr(bld, 'memory_budget', 0) > 0:
+				self.memory = Task.TaskSemaphore(bld.memory_budget * 1024)
 
 	def get_next_task(self):
 		"""
@@ -263,7 +401,9 @@ class Parallel(object):
 						raise Errors.WafError('Broken revdeps detected on %r' % self.incomplete)
 				else:
 					tasks = next(self.biter)
+					self.hash_group(tasks)
 					ready, waiting = self.prio_and_split(tasks)
+					self.scan_group(ready)
 					self.outstanding.extend(ready)
 					self.incomplete.update(waiting)
 					self.total = self.bld.total()
@@ -336,31 +476,72 @@ class Parallel(object):
 			del self.revdeps[tsk]
 
 		if hasattr(tsk, 'semaphore'):
-			sem = tsk.semaphore
-			try:
-				sem.release(tsk)
-			except KeyError:
-				# TODO
-				pass
-			else:
-				while sem.waiting and not sem.is_locked():
-					# take a frozen task, make it ready to run
-					x = sem.waiting.pop()
-					self._add_task(x)
+			self.release_semaphore(tsk.semaphore, tsk)
+		if self.memory:
+			self.release_semaphore(self.memory, tsk)
+
+	def release_semaphore(self, sem, tsk):
+		"""
+		Releases a semaphore held by a task, and makes the tasks waiting for it ready to run
+		as long as the semaphore can be acquired, highest priority first.
+
+		:param sem: semaphore
+		:type sem: :py:class:`waflib.Task.TaskSemaphore`
+		:param tsk: task instance
+		:type tsk: :py:class:`waflib.Task.Task`
+		"""
+		try:
+			sem.release(tsk)
+		except KeyError:
+			# TODO
+			return
+		for x in sorted(sem.waiting):
+			if sem.is_locked():
+				break
+			if not x in sem.waiting:
+				# moved to the memory semaphore by a nested call through _add_task
+				continue
+			# take a frozen task, make it ready to run
+			sem.waiting.remove(x)
+			self._add_task(x)
+
+	def predict_rss(self, tsk):
+		"""
+		Predicts the peak memory usage of a task from the previous builds,
+		see :py:attr:`waflib.Build.BuildContext.task_rss`. Tasks that never ran
+		are assumed to use the average recorded value.
+
+		:param tsk: task instance
+		:type tsk: :py:class:`waflib.Task.Task`
+		:return: memory in kilobytes
+		:rtype: int
+		"""
+		history = self.bld.task_rss
+		try:
+			return history[tsk.uid()]
+		except KeyError:
+			pass
+		try:
+			return self.average_rss
+		except AttributeError:
+			self.average_rss = history and sum(history.values()) // len(history) or 0
+			return self.average_rss
 
 	def get_out(self):
 		"""
-		Waits for a Task that task consumers add to :py:attr:`waflib.Runner.Parallel.out` after execution.
+		Waits for the Tasks that task consumers add to :py:attr:`waflib.Runner.Parallel.out` after execution.
+		All the Tasks available are processed at once.
 		Adds more Tasks if necessary through :py:attr:`waflib.Runner.Parallel.add_more_tasks`.
 
+		:return: the last task processed
 		:rtype: :py:attr:`waflib.Task.Task`
 		"""
-		tsk = self.out.get()
-		if not self.stop:
-			self.add_more_tasks(tsk)
-		self.mark_finished(tsk)
+		for tsk in self.out.get_all():
+			if not self.stop:
+				self.add_more_tasks(tsk)
+			self.mark_finished(tsk)
 
-		self.count -= 1
+			self.count -= 1
 		self.dirty = True
 		return tsk
 
@@ -383,6 +564,15 @@ class Parallel(object):
 				sem.waiting.add(tsk)
 				return
 
+		if self.memory:
+			try:
+				self.memory.acquire(tsk, self.predict_rss(tsk))
+			except IndexError:
+				if hasattr(tsk, 'semaphore'):
+					self.release_semaphore(sem, tsk)
+				self.memory.waiting.add(tsk)
+				return
+
 		self.count += 1
 		self.processed += 1
 		if self.numjobs == 1:
@@ -392,6 +582,7 @@ class Parallel(object):
 			finally:
 				self.out.put(tsk)
 		else:
+			self.spawner.start()
 			self.add_task(tsk)
 
 	def process_task(self, tsk):
@@ -513,12 +704,173 @@ class Parallel(object):
 		while self.error and self.count:
 			self.get_out()
 
-		self.ready.put(None)
+		if self.spawner:
+			self.spawner.stop()
 		if not self.stop:
 			assert not self.count
 			assert not self.postponed
 			assert not self.incomplete
 
+	def hash_group(self, tasks):
+		"""
+		Computes the signatures of the source files used by a build group (inputs, dependency nodes
+		and scanner dependencies of the previous build) in several threads, so that the signatures
+		are found in ``bld.cache_sig`` when the tasks are processed by the main thread.
+		The hash functions release the GIL while hashing.
+
+		Files in the build directory and the outputs of the group are excluded since they may
+		be modified by the tasks. Errors are ignored here, they are raised again when the
+		task signatures are computed.
+
+		:param tasks: tasks of a build group
+		:type tasks: list of :py:class:`waflib.Task.Task`
+		"""
+		if self.numjobs < 2:
+			return
+		bld = self.bld
+		try:
+			cache = bld.cache_sig
+		except AttributeError:
+			cache = bld.cache_sig = {}
+
+		outputs = set()
+		for tsk in tasks:
+			outputs.update(getattr(tsk, 'outputs', ()))
+
+		nodes = set()
+		seen = set(outputs)
+		for tsk in tasks:
+			try:
+				deps = bld.node_deps.get(tsk.uid(), ())
+			except Errors.TaskNotReady:
+				deps = ()
+			for lst in (getattr(tsk, 'inputs', ()), getattr(tsk, 'dep_nodes', ()), deps):
+				for node in lst:
+					if node in seen or node in cache:
+						continue
+					seen.add(node)
+					if not node.is_bld():
+						nodes.add(node)
+
+		if len(nodes) < HASH_MIN:
+			return
+
+		queue = deque(nodes)
+		def hash_nodes():
+			while 1:
+				try:
+					node = queue.pop()
+				except IndexError:
+					break
+				try:
+					node.get_bld_sig()
+				except Exception:
+					pass
+
+		threads = [Utils.threading.Thread(target=hash_nodes) for x in range(min(self.numjobs, len(nodes) // HASH_MIN + 1))]
+		for x in threads:
+			x.daemon = True
+			x.start()
+		for x in threads:
+			x.join()
+
+	def scan_group(self, tasks):
+		"""
+		Runs the dependency scanners of the tasks that are ready to run in forked processes,
+		as the scanners written in Python (such as :py:func:`waflib.Tools.c_preproc.scan`)
+		hold the GIL. Only the scanners marked with a ``process_safe`` attribute are used;
+		the attribute may also be a function returning True for the tasks worth scanning
+		in other processes.
+
+		The task signatures are computed first, and the tasks whose dependencies must be
+		scanned again are interrupted before calling the scanner. The results are then stored
+		in ``bld.scan_results`` for :py:meth:`waflib.Task.Task.sig_implicit_deps`. The tasks
+		not scanned here (errors, missing results) call their scanners as usual.
+
+		The processes are forked once the consumer threads are terminated (they are
+		created again when the next task is enqueued).
+
+		Each process keeps the caches of the scanners while scanning many tasks, and returns
+		each path once (see :py:func:`waflib.Runner.scan_task`). The data returned by the ``process_export``
+		function of a scanner (for example the preprocessor lines read) is given to its ``process_import``
+		function in the main process.
+
+		:param tasks: tasks that are ready to run
+		:type tasks: list of :py:class:`waflib.Task.Task`
+		"""
+		global scan_tasks
+		bld = self.bld
+		if self.numjobs < 2 or bld.is_install < 0:
+			return
+		try:
+			ctx = multiprocessing.get_context('fork')
+		except (AttributeError, ValueError):
+			# no multiprocessing module, no fork (win32) or Python 2
+			return
+
+		lst = []
+		for tsk in tasks:
+			safe = getattr(getattr(tsk, 'scan', None), 'process_safe', False)
+			if callable(safe):
+				safe = safe(tsk)
+			if safe:
+				for k in tsk.run_after:
+					if k.hasrun < Task.SKIPPED:
+						break
+				else:
+					lst.append(tsk)
+		if len(lst) < 2 * SCAN_MIN:
+			return
+
+		# compute the signatures, as Task.runnable_status does
+		results = bld.scan_results
+		stale = []
+		for tsk in lst:
+			key = tsk.uid()
+			results[key] = None
+			try:
+				tsk.signature()
+			except Errors.TaskNotReady:
+				if not key in results:
+					stale.append(tsk)
+			except Exception:
+				pass
+			results.pop(key, None)
+
+		procs = min(self.numjobs, len(stale) // SCAN_MIN)
+		if procs < 2:
+			return
+
+		# nodes of the paths returned by each process
+		tables = {}
+		make_node = bld.root.make_node
+		scan_tasks = stale
+		try:
+			# the consumer threads are idle between build groups, and forking
+			# a process running other threads is unsafe
+			self.spawner.stop(join=True)
+			pool = ctx.Pool(procs)
+			try:
+				for val in pool.imap_unordered(scan_task, range(len(stale)), 1):
+					if len(val) == 1:
+						continue
+					(idx, pid, paths, ids, names, data) = val
+					table = tables.setdefault(pid, [])
+					table.extend(make_node(x) for x in paths)
+					lst = array('I')
+					lst.frombytes(ids)
+
+					tsk = stale[idx]
+					results[tsk.uid()] = ([table[x] for x in lst], names)
+					if data is not None:
+						tsk.scan.process_import(bld, data)
+			finally:
+				pool.terminate()
+		except Exception:
+			Logs.debug('runner: could not scan in processes %s', traceback.format_exc())
+		finally:
+			scan_tasks = []
+
 	def prio_and_split(self, tasks):
 		"""
 		Label input tasks with priority values, and return a pair containing
@@ -529,6 +881,13 @@ class Parallel(object):
 		dependency cycles are found quickly, and builds should be more efficient.
 		A high priority number means that a task is processed first.
 
+		When task durations were recorded by previous builds
+		(:py:attr:`waflib.Build.BuildContext.task_times`), the priority of a task is the
+		length in seconds of the longest chain of tasks starting from it (critical path),
+		so that long chains are started first. Tasks that never ran are assumed to take
+		the average recorded duration, and :py:attr:`waflib.Task.Task.tree_weight` only
+		breaks the ties (see :py:meth:`waflib.Task.Task.priority`).
+
 		This method can be overridden to disable the priority system::
 
 			def prio_and_split(self, tasks):
@@ -555,24 +914,45 @@ class Parallel(object):
 				else:
 					reverse[k].add(x)
 
-		# the priority number is not the tree depth
-		def visit(n):
-			if isinstance(n, Task.TaskGroup):
-				return sum(visit(k) for k in n.next)
+		times = self.bld.task_times
+		if times:
+			default = sum(times.values()) / len(times)
 
-			if n.visited == 0:
-				n.visited = 1
+			# the priority number is the critical path length
+			def visit(n):
+				if isinstance(n, Task.TaskGroup):
+					return max([visit(k) for k in n.next] or [0])
 
-				if n in reverse:
-					rev = reverse[n]
-					n.prio_order = n.tree_weight + len(rev) + sum(visit(k) for k in rev)
-				else:
-					n.prio_order = n.tree_weight
+				if n.visited == 0:
+					n.visited = 1
+
+					n.prio_order = times.get(n.uid(), default)
+					if n in reverse:
+						n.prio_order += max([visit(k) for k in reverse[n]] or [0])
+
+					n.visited = 2
+				elif n.visited == 1:
+					raise Errors.WafError('Dependency cycle found!')
+				return n.prio_order
+		else:
+			# the priority number is not the tree depth
+			def visit(n):
+				if isinstance(n, Task.TaskGroup):
+					return sum(visit(k) for k in n.next)
+
+				if n.visited == 0:
+					n.visited = 1
+
+					if n in reverse:
+						rev = reverse[n]
+						n.prio_order = n.tree_weight + len(rev) + sum(visit(k) for k in rev)
+					else:
+						n.prio_order = n.tree_weight
 
-				n.visited = 2
-			elif n.visited == 1:
-				raise Errors.WafError('Dependency cycle found!')
-			return n.prio_order
+					n.visited = 2
+				elif n.visited == 1:
+					raise Errors.WafError('Dependency cycle found!')
+				return n.prio_order
 
 		for x in tasks:
 			if x.visited != 0:
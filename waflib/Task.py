@@ -6,7 +6,7 @@
 Tasks represent atomic operations such as processes.
 """
 
-import os, re, sys, tempfile, traceback
+import os, re, sys, tempfile, time, traceback
 from waflib import Utils, Logs, Errors
 
 # task states
@@ -256,12 +256,13 @@ class Task(evil):
 
 	def priority(self):
 		"""
-		Priority of execution; the higher, the earlier
+		Priority of execution; the higher, the earlier. The tree weight is compared
+		when the priority orders are equal, as they may be durations.
 
 		:return: the priority value
 		:rtype: a tuple of numeric values
 		"""
-		return (self.weight + self.prio_order, - getattr(self.generator, 'tg_idx_count', 0))
+		return (self.weight + self.prio_order, self.tree_weight, - getattr(self.generator, 'tg_idx_count', 0))
 
 	def split_argfile(self, cmd):
 		"""
@@ -346,6 +347,8 @@ class Task(evil):
 		except KeyError:
 			pass
 
+		Utils.process_stats.maxrss = 0
+		start = time.time()
 		try:
 			ret = self.run()
 		except Exception:
@@ -365,6 +368,10 @@ class Task(evil):
 					self.hasrun = EXCEPTION
 				else:
 					self.hasrun = SUCCESS
+					# durations and memory usage are used by the scheduler in the next builds
+					bld = self.generator.bld
+					bld.task_times[self.uid()] = time.time() - start
+					bld.task_rss[self.uid()] = Utils.process_stats.maxrss
 
 		if self.hasrun != SUCCESS and self.scan:
 			# rescan dependencies on next run
@@ -567,7 +574,7 @@ class Task(evil):
 		try:
 			return self.uid_
 		except AttributeError:
-			m = Utils.md5(self.__class__.__name__)
+			m = Utils.sig_hash(self.__class__.__name__)
 			up = m.update
 			for x in self.inputs + self.outputs:
 				up(x.abspath())
@@ -637,7 +644,7 @@ class Task(evil):
 		except AttributeError:
 			pass
 
-		self.m = Utils.md5(self.hcode)
+		self.m = Utils.sig_hash(self.hcode)
 
 		# explicit deps
 		self.sig_explicit_deps()
@@ -846,7 +853,15 @@ class Task(evil):
 			raise Errors.TaskRescan('rescan')
 
 		# no previous run or the signature of the dependencies has changed, rescan the dependencies
-		(bld.node_deps[key], bld.raw_deps[key]) = self.scan()
+		try:
+			deps = bld.scan_results.pop(key)
+		except KeyError:
+			deps = self.scan()
+		else:
+			if deps is None:
+				# the scanner runs in another process, see waflib.Runner.Parallel.scan_group
+				raise Errors.TaskNotReady('scan deferred')
+		(bld.node_deps[key], bld.raw_deps[key]) = deps
 		if Logs.verbose:
 			Logs.debug('deps: scanner for %s: %r; unresolved: %r', self, bld.node_deps[key], bld.raw_deps[key])
 
@@ -915,7 +930,7 @@ if sys.hexversion > 0x3000000:
 		try:
 			return self.uid_
 		except AttributeError:
-			m = Utils.md5(self.__class__.__name__.encode('latin-1', 'xmlcharrefreplace'))
+			m = Utils.sig_hash(self.__class__.__name__.encode('latin-1', 'xmlcharrefreplace'))
 			up = m.update
 			for x in self.inputs + self.outputs:
 				up(x.abspath().encode('latin-1', 'xmlcharrefreplace'))
@@ -1366,33 +1381,44 @@ class TaskSemaphore(object):
 			semaphore = waflib.Task.TaskSemaphore(2)
 			run_str = 'touch ${TGT}'
 
+	Semaphores may also be weighted, in which case the tasks holding the semaphore
+	may not use more than *num* units of a resource in total. The build scheduler uses
+	this to keep the predicted memory usage of the running tasks below ``--memory-budget``.
+	A task weighting more than the whole capacity is accepted when the semaphore is unused.
+
 	Task semaphores are meant to be used by the build scheduler in the main
 	thread, so there are no guarantees of thread safety.
 	"""
 	def __init__(self, num):
 		"""
-		:param num: maximum value of concurrent tasks
+		:param num: maximum value of concurrent tasks, or total weight of the concurrent tasks
 		:type num: int
 		"""
 		self.num = num
 		self.locking = set()
 		self.waiting = set()
+		self.weights = {}
+		self.used = 0
 
 	def is_locked(self):
 		"""Returns True if this semaphore cannot be acquired by more tasks"""
-		return len(self.locking) >= self.num
+		return self.used >= self.num
 
-	def acquire(self, tsk):
+	def acquire(self, tsk, weight=1):
 		"""
 		Mark the semaphore as used by the given task (not re-entrant).
 
 		:param tsk: task object
 		:type tsk: :py:class:`waflib.Task.Task`
+		:param weight: amount of the resource used by the task
+		:type weight: int
 		:raises: :py:class:`IndexError` in case the resource is already acquired
 		"""
-		if self.is_locked():
+		if self.locking and self.used + weight > self.num:
 			raise IndexError('Cannot lock more %r' % self.locking)
 		self.locking.add(tsk)
+		self.weights[tsk] = weight
+		self.used += weight
 
 	def release(self, tsk):
 		"""
@@ -1403,4 +1429,4 @@ class TaskSemaphore(object):
 		:raises: :py:class:`KeyError` in case the resource is not acquired by the task
 		"""
 		self.locking.remove(tsk)
-
+		self.used -= self.weights.pop(tsk)
@@ -4,9 +4,8 @@
 
 "Base for c programs/libraries"
 
-from waflib import TaskGen, Task
-from waflib.Tools import c_preproc
-from waflib.Tools.ccroot import link_task, stlink_task
+from waflib import TaskGen
+from waflib.Tools.ccroot import compile_task, link_task, stlink_task
 
 @TaskGen.extension('.c')
 def c_hook(self, node):
@@ -15,12 +14,12 @@ def c_hook(self, node):
 		return self.create_compiled_task('cxx', node)
 	return self.create_compiled_task('c', node)
 
-class c(Task.Task):
+class c(compile_task):
 	"Compiles C files into object files"
-	run_str = '${CC} ${ARCH_ST:ARCH} ${CFLAGS} ${FRAMEWORKPATH_ST:FRAMEWORKPATH} ${CPPPATH_ST:INCPATHS} ${DEFINES_ST:DEFINES} ${CC_SRC_F}${SRC} ${CC_TGT_F}${TGT[0].abspath()} ${CPPFLAGS}'
+	run_str = '${CC} ${ARCH_ST:ARCH} ${CFLAGS} ${FRAMEWORKPATH_ST:FRAMEWORKPATH} ${CPPPATH_ST:INCPATHS} ${DEFINES_ST:DEFINES} ${CC_DEPS_F} ${CC_SRC_F}${SRC} ${CC_TGT_F}${TGT[0].abspath()} ${CPPFLAGS}'
 	vars    = ['CCDEPS'] # unused variable to depend on, just in case
 	ext_in  = ['.h'] # set the build order easily by using ext_out=['.h']
-	scan    = c_preproc.scan
+	depfile_var = 'CC_DEPS_F'
 
 class cprogram(link_task):
 	"Links object files into c programs"
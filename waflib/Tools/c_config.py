@@ -8,10 +8,10 @@ C/C++/D configuration helpers
 
 from __future__ import with_statement
 
-import os, re, shlex
-from waflib import Build, Utils, Task, Options, Logs, Errors, Runner
+import os, re, shlex, shutil
+from waflib import Build, Context, Utils, Task, Options, Logs, Errors, Runner
 from waflib.TaskGen import after_method, feature
-from waflib.Configure import conf
+from waflib.Configure import conf, deferrable, get_record_dep
 
 WAF_CONFIG_H   = 'config.h'
 """default name for the config.h file"""
@@ -237,6 +237,401 @@ def validate_cfg(self, kw):
 		if not 'define_name' in kw:
 			kw['define_name'] = self.have_define(kw['uselib_store'])
 
+re_pc_line = re.compile(r'^([A-Za-z0-9_.]+)\s*([:=])\s*(.*)$')
+re_pc_var = re.compile(r'\$\{([^}]*)\}')
+re_pc_name = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.+-]*$')
+re_pc_version = re.compile(r'^[0-9.]+$')
+
+cfg_lock = Utils.threading.Lock()
+"""Lock protecting the creation of the per-command locks of :py:func:`waflib.Tools.c_config.run_cfg`"""
+
+def get_cfg_cache(self):
+	"""
+	Returns the dict holding the *-config* results of the configuration session, it is shared
+	with the contexts of the parallel configuration tests (see :py:class:`waflib.Configure.deferred_check`)
+
+	:rtype: dict
+	"""
+	ctx = getattr(self, 'conf', self)
+	try:
+		return ctx.cfg_cache
+	except AttributeError:
+		ctx.cfg_cache = {}
+		return ctx.cfg_cache
+
+def run_cfg(self, cmd, env):
+	"""
+	Executes a *-config* program for :py:func:`waflib.Tools.c_config.exec_cfg`. The outputs and errors
+	are kept for the whole configuration session (see :py:func:`waflib.Tools.c_config.get_cfg_cache`),
+	and a command is executed once when the same test runs in several threads
+
+	:param cmd: command to execute
+	:type cmd: list of string
+	:param env: environment variables, or None
+	:type env: dict
+	:return: the command output
+	:rtype: string
+	"""
+	cache = get_cfg_cache(self)
+	key = Utils.h_list((cmd, env and sorted(env.items())))
+	with cfg_lock:
+		lock = cache.setdefault(('lock', key), Utils.threading.Lock())
+	with lock:
+		try:
+			ret = cache[key]
+		except KeyError:
+			try:
+				ret = self.cmd_and_log(cmd, env=env)
+			except Errors.WafError as e:
+				ret = e
+			cache[key] = ret
+	if isinstance(ret, Errors.WafError):
+		raise ret
+	return ret
+
+def read_pc(path):
+	"""
+	Parses a pkg-config *.pc* file, expanding the variables in the values
+
+	:param path: file path
+	:type path: string
+	:return: a pair of dicts (variables, fields), or None if the file uses unsupported features;
+		the fields containing quotes are set to None
+	:rtype: tuple
+	"""
+	try:
+		code = Utils.readf(path, m='r')
+	except EnvironmentError:
+		return None
+
+	variables = {'pcfiledir': os.path.dirname(path)}
+	fields = {}
+	def repl(m):
+		try:
+			return variables[m.group(1)]
+		except KeyError:
+			raise ValueError(m.group(1))
+
+	for line in code.splitlines():
+		if '\\' in line.split('#', 1)[0] or line.endswith('\\'):
+			# escapes and line continuations
+			return None
+		line = line.split('#', 1)[0].strip()
+		if not line:
+			continue
+		m = re_pc_line.match(line)
+		if not m:
+			return None
+		try:
+			val = re_pc_var.sub(repl, m.group(3))
+		except ValueError:
+			# undefined or builtin variable such as pc_sysrootdir
+			return None
+		# the field names are not case-sensitive (CFlags, Cflags)
+		name = m.group(1) if m.group(2) == '=' else m.group(1).capitalize()
+		if '"' in val or "'" in val:
+			# pkgconf removes the quotes, pkg-config does not
+			if m.group(2) == ':':
+				fields[name] = None
+			continue
+		if m.group(2) == '=':
+			variables[name] = val
+		else:
+			fields[name] = val
+	return (variables, fields)
+
+def find_pc(self, kw, env, name):
+	"""
+	Finds and parses the *.pc* file of a package, see :py:func:`waflib.Tools.c_config.exec_cfg`.
+	The folders of the search path are listed once per configuration session.
+
+	:param kw: parameters of :py:func:`waflib.Tools.c_config.exec_cfg`
+	:type kw: dict
+	:param env: environment variables for pkg-config, or None
+	:type env: dict
+	:param name: package name
+	:type name: string
+	:return: the result of :py:func:`waflib.Tools.c_config.read_pc`, False for a missing package,
+		or None when pkg-config must be executed
+	"""
+	path = Utils.to_list(kw['path'])
+	if len(path) != 1 or Utils.is_win32:
+		return None
+	if not os.path.basename(path[0]) in ('pkg-config', 'pkgconf'):
+		# cross-compilation wrappers, sdl-config, ...
+		return None
+	if kw.get('define_variable') or self.env.PKG_CONFIG_DEFINES:
+		return None
+	if not name or '/' in name or name.endswith('.pc') or name in ('pkg-config', 'pkgconf'):
+		return None
+
+	environ = env or os.environ
+	for x in ('PKG_CONFIG_SYSROOT_DIR', 'PKG_CONFIG_TOP_BUILD_DIR'):
+		if environ.get(x):
+			return None
+
+	cache = get_cfg_cache(self)
+	libdir = environ.get('PKG_CONFIG_LIBDIR')
+	key = ('pc index', path[0], environ.get('PKG_CONFIG_PATH'), libdir)
+	try:
+		(dirs, index) = cache[key]
+	except KeyError:
+		if libdir is None:
+			try:
+				libdir = run_cfg(self, path + ['--variable=pc_path', 'pkg-config'], env).strip()
+			except Errors.WafError:
+				libdir = ''
+		dirs = environ.get('PKG_CONFIG_PATH', '').split(os.pathsep) + libdir.split(os.pathsep)
+		index = {}
+		for d in dirs:
+			try:
+				lst = os.listdir(d)
+			except OSError:
+				continue
+			for x in lst:
+				if x.endswith('.pc'):
+					index.setdefault(x[:-3], os.path.join(d, x))
+		cache[key] = (dirs, index)
+
+	record_dep = get_record_dep(self)
+	if record_dep:
+		# packages added or removed invalidate incremental configurations
+		for d in dirs:
+			if os.path.isabs(d):
+				record_dep(d)
+
+	if name + '-uninstalled' in index:
+		return None
+	try:
+		pc = index[name]
+	except KeyError:
+		return False
+	if record_dep:
+		record_dep(pc)
+	try:
+		return cache[pc]
+	except KeyError:
+		ret = cache[pc] = read_pc(pc)
+		return ret
+
+PC_ENVIRON = ('PKG_CONFIG_PATH', 'PKG_CONFIG_LIBDIR')
+"""Environment variables of pkgconf supported by :py:func:`waflib.Tools.c_config.get_pc_flags`"""
+
+PC_UNMERGEABLE = ('-framework', '-isystem', '-idirafter', '-pthread', '-Wa,', '-Wl,', '-Wp,', '-trigraphs',
+	'-pedantic', '-ansi', '-std=', '-stdlib=', '-include', '-nostdinc', '-nostdlibinc', '-nobuiltininc')
+"""Flags that pkgconf does not merge with the previous flags"""
+
+PC_GROUPABLE = ('-Wl,--start-group', '-framework', '-isystem', '-idirafter', '-include')
+"""Flags that pkgconf groups with the following ones (not supported)"""
+
+re_pc_vertok = re.compile(r'[0-9]+|[A-Za-z]+|~')
+
+def pc_compare_versions(a, b):
+	"""
+	Compares two package versions like pkgconf (rpm version comparison)
+
+	:rtype: int
+	"""
+	if a.lower() == b.lower():
+		return 0
+	x = re_pc_vertok.findall(a)
+	y = re_pc_vertok.findall(b)
+	while x and y:
+		(i, j) = (x.pop(0), y.pop(0))
+		if i == '~' or j == '~':
+			if i != j:
+				return -1 if i == '~' else 1
+			continue
+		if i.isdigit() != j.isdigit():
+			return 1 if i.isdigit() else -1
+		if i.isdigit():
+			(i, j) = (int(i), int(j))
+		if i != j:
+			return 1 if i > j else -1
+	if x and x[0] == '~':
+		return -1
+	if y and y[0] == '~':
+		return 1
+	return len(x) and 1 or (len(y) and -1 or 0)
+
+PC_OPERATORS = {
+	'<': lambda x: x < 0,
+	'<=': lambda x: x <= 0,
+	'=': lambda x: x == 0,
+	'==': lambda x: x == 0,
+	'!=': lambda x: x != 0,
+	'>=': lambda x: x >= 0,
+	'>': lambda x: x > 0,
+}
+
+def pc_requires(val):
+	"""
+	Parses a ``Requires`` field of a *.pc* file
+
+	:return: a list of (name, operator, version), or None if the syntax is not supported
+	:rtype: list of tuple
+	"""
+	if val is None:
+		return None
+	ret = []
+	lst = [x for x in re.split(r'[\s,]+', val) if x]
+	while lst:
+		name = lst.pop(0)
+		if not re_pc_name.match(name):
+			return None
+		if lst and lst[0] in PC_OPERATORS:
+			if len(lst) < 2:
+				return None
+			ret.append((name, lst.pop(0), lst.pop(0)))
+		elif lst and lst[0][0] in '<>=!':
+			return None
+		else:
+			ret.append((name, None, None))
+	return ret
+
+def pc_fragments(val):
+	"""
+	Splits a ``Cflags`` or ``Libs`` field of a *.pc* file into (type, data) fragments as pkgconf does
+
+	:return: the fragments, or None if the field uses unsupported features
+	:rtype: list of tuple
+	"""
+	if val is None:
+		return None
+	ret = []
+	for x in val.split():
+		if x.startswith(PC_GROUPABLE):
+			return None
+		if not x.startswith('-') or x.startswith('-lib:') or x.startswith(PC_UNMERGEABLE):
+			ret.append(('', x))
+		elif len(x) < 3:
+			# the value is the next argument
+			return None
+		else:
+			ret.append((x[1], x[2:]))
+	return ret
+
+def pc_merge(lst, frag):
+	"""
+	Adds a fragment to a list like ``pkgconf_fragment_copy`` in pkgconf: the include and library
+	folders are kept once (first occurrence), and the other flags are moved to the end of the list
+	"""
+	(kind, data) = frag
+	def lookup():
+		for i in range(len(lst) - 1, -1, -1):
+			if lst[i] == frag:
+				return i
+		return None
+
+	merge_back = not kind in ('F', 'L', 'I')
+	if merge_back and (not data.startswith('-') or data.startswith(PC_UNMERGEABLE)):
+		i = lookup()
+		if i is not None:
+			# remove the previous occurrence unless it follows an unrelated flag
+			parent = i and lst[i - 1][0]
+			if not i or parent in ('l', 'L', 'I') or not kind or parent == kind:
+				del lst[i]
+	elif not merge_back and lookup() is not None:
+		return
+	lst.append(frag)
+
+def get_pc_sysdirs(self, path, env):
+	"""
+	Returns the system include and library folders filtered by pkgconf (the command
+	is executed once per configuration session)
+
+	:return: two lists of folders, or None if the program is not pkgconf
+	:rtype: tuple
+	"""
+	cache = get_cfg_cache(self)
+	key = ('pc sysdirs', path[0])
+	try:
+		return cache[key]
+	except KeyError:
+		pass
+	try:
+		out = run_cfg(self, path + ['--dump-personality'], env)
+	except Errors.WafError:
+		ret = None
+	else:
+		dirs = {}
+		for line in out.splitlines():
+			(k, _, v) = line.partition(':')
+			dirs[k.strip()] = [os.path.normpath(x) for x in v.split()]
+		ret = None
+		if 'SystemIncludePaths' in dirs and 'SystemLibraryPaths' in dirs:
+			ret = (dirs['SystemIncludePaths'], dirs['SystemLibraryPaths'])
+	cache[key] = ret
+	return ret
+
+def get_pc_flags(self, kw, env, packages, args):
+	"""
+	Computes the output of ``pkg-config --cflags --libs`` from the *.pc* files of the packages
+	and of their dependencies (``Requires``, and ``Requires.private`` for the compilation flags)
+	like pkgconf does, so that pkg-config is not executed for each package. The flags are merged
+	by :py:func:`waflib.Tools.c_config.pc_merge` and the system folders are removed.
+
+	:param kw: parameters of :py:func:`waflib.Tools.c_config.exec_cfg`
+	:type kw: dict
+	:param env: environment variables for pkg-config, or None
+	:type env: dict
+	:param packages: package names
+	:type packages: list of string
+	:param args: ``--cflags`` and/or ``--libs``
+	:type args: list of string
+	:return: the flags, or None when pkg-config must be executed (unsupported features, errors)
+	:rtype: string
+	"""
+	if not args or set(args) - set(['--cflags', '--libs']):
+		return None
+	environ = env or os.environ
+	for x in environ:
+		if x.startswith('PKG_CONFIG_') and not x in PC_ENVIRON or x in ('CPATH', 'C_INCLUDE_PATH', 'CPLUS_INCLUDE_PATH'):
+			return None
+	path = Utils.to_list(kw['path'])
+	sysdirs = get_pc_sysdirs(self, path, env)
+	if not sysdirs:
+		return None
+
+	def get(name):
+		pc = find_pc(self, kw, env, name)
+		if not pc or pc[1].get('Conflicts'):
+			raise ValueError(name)
+		return pc
+
+	def collect(field, private):
+		ret = []
+		def visit(name, op, version, stack):
+			if name in stack:
+				raise ValueError(name)
+			pc = get(name)
+			if op and not PC_OPERATORS[op](pc_compare_versions(pc[1].get('Version') or '', version)):
+				raise ValueError(name)
+			frags = pc_fragments(pc[1].get(field, ''))
+			if frags is None:
+				raise ValueError(name)
+			for x in frags:
+				pc_merge(ret, x)
+			for req in ('Requires', 'Requires.private') if private else ('Requires',):
+				deps = pc_requires(pc[1].get(req, ''))
+				if deps is None:
+					raise ValueError(name)
+				for x in deps:
+					visit(x[0], x[1], x[2], stack + [name])
+		for x in packages:
+			visit(x, None, None, [])
+		return ret
+
+	try:
+		frags = []
+		if '--cflags' in args:
+			frags += [x for x in collect('Cflags', True) if x[0] != 'I' or not os.path.normpath(x[1]) in sysdirs[0]]
+		if '--libs' in args:
+			frags += [x for x in collect('Libs', False) if x[0] != 'L' or not os.path.normpath(x[1]) in sysdirs[1]]
+	except (ValueError, KeyError):
+		return None
+	return ' '.join(x[0] and '-' + x[0] + x[1] or x[1] for x in frags)
+
 @conf
 def exec_cfg(self, kw):
 	"""
@@ -246,6 +641,11 @@ def exec_cfg(self, kw):
 	* if modversion is given, then return the module version
 	* else, execute the *-config* program with the *args* and *variables* given, and set the flags on the *conf.env.FLAGS_name* variable
 
+	The versions, the variables, the missing packages and the ``--cflags``/``--libs`` flags are read
+	from the *.pc* files directly when pkg-config is used without options affecting them (see
+	:py:func:`waflib.Tools.c_config.find_pc` and :py:func:`waflib.Tools.c_config.get_pc_flags`),
+	and the outputs of the commands are kept for the configuration session.
+
 	:param atleast_pkgconfig_version: minimum pkg-config version to use (disable other tests)
 	:type atleast_pkgconfig_version: string
 	:param package: package name, for example *gtk+-2.0*
@@ -283,12 +683,27 @@ def exec_cfg(self, kw):
 	# pkg-config version
 	if 'atleast_pkgconfig_version' in kw:
 		cmd = path + ['--atleast-pkgconfig-version=%s' % kw['atleast_pkgconfig_version']]
-		self.cmd_and_log(cmd, env=env)
+		run_cfg(self, cmd, env)
 		return
 
+	def read_it(name):
+		# read the .pc files instead of executing pkg-config when possible
+		if not re_pc_name.match(name) or re_pc_version.match(name):
+			return None
+		pc = find_pc(self, kw, env, name)
+		if pc is False:
+			msg = 'Package %r was not found in the pkg-config search path' % name
+			self.to_log(msg)
+			raise Errors.WafError(msg)
+		return pc
+
 	# single version for a module
 	if 'modversion' in kw:
-		version = self.cmd_and_log(path + ['--modversion', kw['modversion']], env=env).strip()
+		pc = read_it(kw['modversion'])
+		if pc and pc[1].get('Version'):
+			version = pc[1]['Version']
+		else:
+			version = run_cfg(self, path + ['--modversion', kw['modversion']], env).strip()
 		if not 'okmsg' in kw:
 			kw['okmsg'] = version
 		self.define(kw['define_name'], version)
@@ -303,6 +718,7 @@ def exec_cfg(self, kw):
 		lst.append('--define-variable=%s=%s' % (key, val))
 
 	static = kw.get('force_static', False)
+	args = []
 	if 'args' in kw:
 		args = Utils.to_list(kw['args'])
 		if '--static' in args or '--static-libs' in args:
@@ -310,26 +726,40 @@ def exec_cfg(self, kw):
 		lst += args
 
 	# tools like pkgconf expect the package argument after the -- ones -_-
-	lst.extend(Utils.to_list(kw['package']))
+	packages = Utils.to_list(kw['package'])
+	lst.extend(packages)
+	if all(re_pc_name.match(x) and not re_pc_version.match(x) for x in packages):
+		pcs = [read_it(x) for x in packages]
+	else:
+		# version constraints such as 'zlib >= 1.0' are left to pkg-config
+		pcs = [None]
 
 	# retrieving variables of a module
 	if 'variables' in kw:
 		v_env = kw.get('env', self.env)
 		vars = Utils.to_list(kw['variables'])
 		for v in vars:
-			val = self.cmd_and_log(lst + ['--variable=' + v], env=env).strip()
+			if len(pcs) == 1 and pcs[0] and len(lst) == len(path) + 1 and v in pcs[0][0]:
+				val = pcs[0][0][v]
+			else:
+				val = run_cfg(self, lst + ['--variable=' + v], env).strip()
 			var = '%s_%s' % (kw['uselib_store'], v)
 			v_env[var] = val
 		return
 
 	# so we assume the command-line will output flags to be parsed afterwards
-	ret = self.cmd_and_log(lst, env=env)
+	ret = None
+	if all(pcs) and len(lst) == len(path) + len(args) + len(packages):
+		ret = get_pc_flags(self, kw, env, packages, args)
+	if ret is None:
+		ret = run_cfg(self, lst, env)
 
 	define_it()
 	self.parse_flags(ret, kw['uselib_store'], kw.get('env', self.env), force_static=static, posix=kw.get('posix'))
 	return ret
 
 @conf
+@deferrable
 def check_cfg(self, *k, **kw):
 	"""
 	Checks for configuration flags using a **-config**-like program (pkg-config, sdl-config, etc).
@@ -615,6 +1045,7 @@ def post_check(self, *k, **kw):
 	return is_success
 
 @conf
+@deferrable
 def check(self, *k, **kw):
 	"""
 	Performs a configuration test by calling :py:func:`waflib.Configure.run_build`.
@@ -633,9 +1064,13 @@ def check(self, *k, **kw):
 	"""
 	self.validate_c(kw)
 	self.start_msg(kw['msg'], **kw)
+	if 'header_name' in kw and get_record_dep(self):
+		record_headers(self, kw)
 	ret = None
 	try:
-		ret = self.run_build(*k, **kw)
+		ret = get_probe_result(self, kw)
+		if ret is None:
+			ret = self.run_build(*k, **kw)
 	except self.errors.ConfigurationError:
 		self.end_msg(kw['errmsg'], 'YELLOW', **kw)
 		if Logs.verbose > 1:
@@ -689,6 +1124,326 @@ def test_exec_fun(self):
 	"""
 	self.create_task('test_exec', self.link_task.outputs[0])
 
+
+def get_search_dirs(self, env, mode):
+	"""
+	Returns the default include and library folders of gcc and clang (compiler executed once per configuration session)
+
+	:param env: configuration set of the test
+	:type env: :py:class:`waflib.ConfigSet.ConfigSet`
+	:param mode: c or cxx
+	:type mode: string
+	:return: include folders and library folders
+	:rtype: tuple
+	"""
+	if mode == 'cxx':
+		cc, name = env.CXX, env.CXX_NAME
+	else:
+		cc, name = env.CC, env.CC_NAME
+	if not cc or not name in ('gcc', 'clang'):
+		return ([], [])
+	cache = get_cfg_cache(self)
+	key = ('search dirs', tuple(Utils.to_list(cc)), mode)
+	try:
+		return cache[key]
+	except KeyError:
+		pass
+
+	cc = Utils.to_list(cc)
+	incs = []
+	try:
+		err = self.cmd_and_log(cc + ['-E', '-v', '-x', mode == 'cxx' and 'c++' or 'c', os.devnull], output=Context.STDERR, quiet=Context.BOTH)
+	except Errors.WafError:
+		err = ''
+	found = False
+	for line in err.splitlines():
+		if line.startswith('#include <...> search starts here'):
+			found = True
+		elif line.startswith('End of search list'):
+			break
+		elif found and line.startswith(' '):
+			incs.append(os.path.normpath(line.strip().split(' (')[0]))
+
+	libs = []
+	try:
+		out = self.cmd_and_log(cc + ['-print-search-dirs'], quiet=Context.BOTH)
+	except Errors.WafError:
+		out = ''
+	for line in out.splitlines():
+		if line.startswith('libraries: ='):
+			for x in line[len('libraries: ='):].split(os.pathsep):
+				x = os.path.normpath(x)
+				if x and not x in libs:
+					libs.append(x)
+
+	ret = cache[key] = (incs, libs)
+	return ret
+
+def get_header_paths(dirs, headers):
+	"""
+	Returns the possible locations of headers, and their folders
+
+	:param dirs: include folders
+	:type dirs: list of string
+	:param headers: header names
+	:type headers: list of string
+	:rtype: list of string
+	"""
+	ret = []
+	for d in dirs:
+		for x in Utils.to_list(headers):
+			path = os.path.join(d, x)
+			ret.append(path)
+			ret.append(os.path.dirname(path))
+	return ret
+
+@conf
+def get_test_inputs(self, kw):
+	"""
+	Returns the files and folders whose changes may affect the result of a test executed
+	by :py:func:`waflib.Configure.run_build`: the default include and library folders of the compiler,
+	and the possible locations of the headers of the header tests
+
+	:param kw: parameters of :py:func:`waflib.Configure.run_build`
+	:type kw: dict
+	:rtype: list of string
+	"""
+	(incs, libs) = get_search_dirs(self, kw['env'], kw.get('compile_mode', 'c'))
+	ret = incs + libs
+	if 'header_name' in kw:
+		from waflib.Configure import get_test_dirs
+		ret += get_header_paths(get_test_dirs(kw, ['INCLUDES']) + incs, kw['header_name'])
+	return ret
+
+def record_headers(self, kw):
+	"""
+	Adds the possible locations of the headers of a test to the inputs of an incremental
+	configuration (see :py:meth:`waflib.Configure.ConfigurationContext.record_dep`), so that
+	the test is executed again when a header is added or removed
+
+	:param kw: parameters processed by :py:func:`waflib.Tools.c_config.validate_c`
+	:type kw: dict
+	"""
+	for x in self.get_test_inputs(kw):
+		self.record_dep(x)
+
+PROBE_KEYS = set(['header_name', 'uselib_store', 'msg', 'okmsg', 'errmsg', 'define_name', 'auto_add_header_name',
+	'compiler', 'compile_mode', 'type', 'features', 'compile_filename', 'code', 'build_fun', 'env', 'execute',
+	'success', 'comment', 'global_define', 'quote', 'quiet', 'link_header_test', 'add_have_to_env'])
+"""Parameters of the tests that :py:func:`waflib.Tools.c_config.probe_checks` may answer"""
+
+re_probe_code = re.compile(r'^(?:#include <[^>\n]+>\n|\n)*$')
+
+def probe_key(self, kw):
+	"""
+	Returns the key of a header test for :py:func:`waflib.Tools.c_config.probe_checks`, or None
+	if the test must be built normally. Only the variables used by the test build are considered,
+	and the defines are excluded as the header tests add them to ``conf.env`` in turn.
+
+	:param kw: parameters processed by :py:func:`waflib.Tools.c_config.validate_c`
+	:type kw: dict
+	:return: a group key and the headers to include
+	:rtype: tuple
+	"""
+	if set(kw.keys()) - PROBE_KEYS or kw['build_fun'] is not build_fun or kw['execute']:
+		return None
+	code = kw['code']
+	if not code.endswith(SNIP_EMPTY_PROGRAM) or not re_probe_code.match(code[:-len(SNIP_EMPTY_PROGRAM)]):
+		return None
+
+	env = kw['env']
+	mode = kw['compile_mode']
+	if (mode == 'cxx' and env.CXX_NAME or env.CC_NAME) not in ('gcc', 'clang'):
+		return None
+	if kw['features'] != [mode] and kw['features'] != [mode, kw['type']]:
+		return None
+	if not kw['type'] in ('cprogram', 'cxxprogram'):
+		return None
+	for x in Utils.to_list(env.INCLUDES):
+		if not os.path.isabs(x):
+			return None
+
+	# variables of the compilation and link tasks, see waflib.Configure.user_cache_key
+	from waflib.Tools import ccroot
+	names = set()
+	for x in kw['features'] + [mode + 'program']:
+		names.update(ccroot.USELIB_VARS.get(x, ()))
+		cls = Task.classes.get(x)
+		if cls:
+			names.update(cls.vars)
+	names.update(['%s_%s' % (var, x) for var in list(names) for x in kw['features']])
+	names.discard('DEFINES')
+	lst = [(x, env[x]) for x in sorted(names)]
+	return (Utils.h_list((mode, kw['features'], kw['compile_filename'], lst)), code)
+
+def get_probe_result(self, kw):
+	"""
+	Returns the result of a header test answered by :py:func:`waflib.Tools.c_config.probe_checks`
+
+	:param kw: parameters processed by :py:func:`waflib.Tools.c_config.validate_c`
+	:type kw: dict
+	:return: 0 if the test succeeded, None if it must be built normally
+	:raises: :py:class:`waflib.Errors.ConfigurationError` if the headers were not found
+	"""
+	results = getattr(self, 'probe_results', None)
+	if not results:
+		return None
+	key = probe_key(self, kw)
+	if not key in results:
+		return None
+	ret = results[key]
+	self.to_log('using the result of the compiler probe for %r' % kw['header_name'])
+	if isinstance(ret, str):
+		self.fatal(ret)
+	return ret
+
+def get_probe_cmd(env, mode, features):
+	"""
+	Returns the compiler command-line of a header test, see the *run_str* of :py:class:`waflib.Tools.c.c`
+
+	:rtype: list of string
+	"""
+	def get(var, st=None):
+		ret = Utils.to_list(env[var])
+		for x in features:
+			ret = ret + Utils.to_list(env['%s_%s' % (var, x)])
+		if st:
+			st = env[st]
+			if isinstance(st, str):
+				ret = [st % x for x in ret]
+			else:
+				ret = [y for x in ret for y in st + [x]]
+		return ret
+	if mode == 'cxx':
+		cmd, flags = env.CXX, 'CXXFLAGS'
+	else:
+		cmd, flags = env.CC, 'CFLAGS'
+	return (Utils.to_list(cmd) + get('ARCH', 'ARCH_ST') + get(flags) + get('FRAMEWORKPATH', 'FRAMEWORKPATH_ST')
+		+ get('INCLUDES', 'CPPPATH_ST') + get('DEFINES', 'DEFINES_ST') + get('CPPFLAGS'))
+
+@conf
+def probe_checks(self, queue):
+	"""
+	Answers the header tests queued by :py:meth:`waflib.Configure.ConfigurationContext.defer_checks`
+	with a few compiler invocations instead of one test build per header (gcc and clang only).
+	The tests sharing the same compiler flags are processed together:
+
+	* a single preprocessor run evaluates ``__has_include`` for all the headers, the tests of missing headers fail
+	* a single compiler run builds the test files of the headers found, each in its own object file
+	* the link is verified by building one of the tests normally, the other tests then succeed
+
+	The tests that cannot be answered this way (compilation errors, parameters other than
+	headers) are built normally by :py:func:`waflib.Tools.c_config.check`, so that
+	the return values, the defines, the messages and the errors are unchanged.
+
+	:param queue: tests queued by :py:meth:`waflib.Configure.ConfigurationContext.defer_checks`
+	:type queue: list of tuple
+	:return: the indices of the tests answered in the queue
+	:rtype: set of int
+	"""
+	groups = {}
+	env = self.env
+	# the headers added to INCKEYS by the previous tests (auto_add_header_name) are included
+	# in the test code, assuming that the previous tests succeed
+	inckeys = env.derive()
+	for (i, (name, k, kw)) in enumerate(queue):
+		if name != 'check' or k or not Utils.to_list(kw.get('header_name')):
+			continue
+		kw = dict(kw)
+		kw.pop('mandatory', None)
+		self.env = inckeys.derive() # validate_c removes the define from conf.env
+		try:
+			self.validate_c(kw)
+		except Errors.WafError:
+			continue
+		finally:
+			self.env = env
+		if kw.get('auto_add_header_name'):
+			inckeys.append_value(INCKEYS, Utils.to_list(kw['header_name']))
+		key = probe_key(self, kw)
+		if key:
+			groups.setdefault(key[0], []).append((i, kw, key))
+
+	ret = set()
+	base = self.bldnode.abspath() + os.sep + (not Utils.is_win32 and '.' or '') + 'conf_probe'
+	# files left by an interrupted configuration
+	shutil.rmtree(base, ignore_errors=True)
+	try:
+		for (n, lst) in enumerate(groups.values()):
+			if len(lst) > 1:
+				ret.update(self.probe_group(os.path.join(base, str(n)), lst))
+	finally:
+		shutil.rmtree(base, ignore_errors=True)
+	return ret
+
+@conf
+def probe_group(self, dir, lst):
+	"""
+	Executes the compiler probes for header tests sharing the same flags, see :py:func:`waflib.Tools.c_config.probe_checks`
+
+	:param dir: folder for the test files
+	:type dir: string
+	:param lst: queue indices, parameters and keys of the tests
+	:type lst: list of tuple
+	:return: the indices of the tests answered
+	:rtype: list of int
+	"""
+	kw = lst[0][1]
+	cmd = get_probe_cmd(kw['env'], kw['compile_mode'], kw['features'])
+	ext = os.path.splitext(kw['compile_filename'])[1]
+	os.makedirs(dir)
+
+	def headers(kw):
+		return re.findall(r'#include <([^>\n]+)>', kw['code'])
+
+	code = ['#ifdef __has_include', 'waf_probe_supported']
+	for (j, (i, kw, key)) in enumerate(lst):
+		code.append('#if %s' % ' && '.join('__has_include(<%s>)' % x for x in headers(kw)))
+		code.append('waf_probe_%d_found' % j)
+		code.append('#endif')
+	code.append('#endif\n')
+	src = os.path.join(dir, 'probe' + ext)
+	Utils.writef(src, '\n'.join(code))
+	try:
+		out = self.cmd_and_log(cmd + ['-E', src], cwd=dir)
+	except Errors.WafError:
+		return []
+	if not 'waf_probe_supported' in out.split():
+		return []
+
+	found = set(int(x) for x in re.findall(r'\bwaf_probe_(\d+)_found\b', out))
+	ret = []
+	for (j, (i, kw, key)) in enumerate(lst):
+		if not j in found:
+			self.probe_results[key] = 'Test does not build: the compiler does not find %s' % ', '.join(headers(kw))
+			ret.append(i)
+
+	srcs = []
+	for j in found:
+		srcs.append('probe_%d%s' % (j, ext))
+		Utils.writef(os.path.join(dir, srcs[-1]), lst[j][1]['code'])
+	if not srcs:
+		return ret
+	try:
+		self.cmd_and_log(cmd + ['-c'] + srcs, cwd=dir)
+	except Errors.WafError:
+		# each file has its own object file, the successful ones are kept
+		pass
+	compiled = [j for j in sorted(found) if os.path.exists(os.path.join(dir, 'probe_%d.o' % j))]
+
+	if compiled and len(lst[compiled[0]][1]['features']) > 1:
+		# the link command-line is the same for all the tests of the group
+		try:
+			self.run_build(**lst[compiled[0]][1])
+		except Errors.ConfigurationError:
+			compiled = []
+
+	for j in compiled:
+		(i, kw, key) = lst[j]
+		self.probe_results[key] = 0
+		ret.append(i)
+	return ret
+
 @conf
 def check_cxx(self, *k, **kw):
 	"""
@@ -1255,6 +2010,10 @@ def multicheck(self, *k, **kw):
 		def __init__(self):
 			self.keep = False
 			self.task_sigs = {}
+			self.node_deps = {}
+			self.task_times = {}
+			self.task_rss = {}
+			self.is_install = 0
 			self.progress_bar = 0
 		def total(self):
 			return len(tasks)
@@ -24,9 +24,13 @@ It only works with gcc >= 4.4 though.
 
 A dumb preprocessor is also available in the tool *c_dumbpreproc*
 """
-# TODO: more varargs, pragma once
+# TODO: more varargs
 
-import re, string, traceback
+import os, re, string, struct, time, traceback
+try:
+	import cPickle
+except ImportError:
+	import pickle as cPickle
 from waflib import Logs, Utils, Errors
 
 class PreprocError(Errors.WafError):
@@ -35,6 +39,15 @@ class PreprocError(Errors.WafError):
 FILE_CACHE_SIZE = 100000
 LINE_CACHE_SIZE = 100000
 
+TREE_ENTRIES = 8
+"""Maximum amount of include trees kept for a header (one for each macro state), see :py:class:`waflib.Tools.c_preproc.include_frame`"""
+
+EVAL_ENTRIES = 8
+"""Maximum amount of results kept for an #if/#elif expression (one for each state of the macros it reads), see :py:meth:`waflib.Tools.c_preproc.c_parser.eval_line`"""
+
+LINES_FILE = 'c_preproc_lines'
+"""File of the build cache directory holding the preprocessor lines of the files parsed, see :py:class:`waflib.Tools.c_preproc.lines_store`"""
+
 POPFILE = '-'
 "Constant representing a special token used in :py:meth:`waflib.Tools.c_preproc.c_parser.start` iteration to switch to a header read previously"
 
@@ -84,6 +97,9 @@ re_fun = re.compile('^[a-zA-Z_][a-zA-Z0-9_]*[(]')
 re_pragma_once = re.compile(r'^\s*once\s*', re.IGNORECASE)
 """Match #pragma once statements"""
 
+re_guard = re.compile(r'^\s*!\s*defined\s*(?:\(\s*([a-zA-Z_]\w*)\s*\)|([a-zA-Z_]\w*))\s*$')
+"""Match #if !defined(X) include guards"""
+
 re_nl = re.compile('\\\\\r*\n', re.MULTILINE)
 """Match newlines"""
 
@@ -137,6 +153,9 @@ undefined = 'u'
 skipped   = 's'
 """Parser state is *skipped*, for example preprocessor lines in a #elif 0 block"""
 
+undefined_macro = object()
+"""Value recorded for macros that are not defined, see :py:class:`waflib.Tools.c_preproc.macro_table`"""
+
 def repl(m):
 	"""Replace function used with :py:attr:`waflib.Tools.c_preproc.re_cpp`"""
 	s = m.group()
@@ -432,10 +451,9 @@ def reduce_tokens(lst, defs, ban=[]):
 
 		elif p == IDENT and v in defs:
 
-			if isinstance(defs[v], str):
-				a, b = extract_macro(defs[v])
-				defs[v] = b
 			macro_def = defs[v]
+			if isinstance(macro_def, str):
+				macro_def = parse_macro(macro_def)
 			to_add = macro_def[1]
 
 			if isinstance(macro_def[0], list):
@@ -660,6 +678,25 @@ def extract_macro(txt):
 			# empty define, assign an empty token
 			return (v, [[], [('T','')]])
 
+parsed_macros = Utils.lru_cache(LINE_CACHE_SIZE)
+"""Definitions parsed by :py:func:`waflib.Tools.c_preproc.parse_macro`, by define line"""
+
+def parse_macro(line):
+	"""
+	Memoized :py:func:`waflib.Tools.c_preproc.extract_macro`; the macro definitions
+	are kept as strings so that the parser states can be compared
+
+	:param line: define line
+	:type line: string
+	:return: the list of arguments and the replacement (must not be modified)
+	:rtype: list
+	"""
+	try:
+		return parsed_macros[line]
+	except KeyError:
+		ret = parsed_macros[line] = extract_macro(line)[1]
+		return ret
+
 re_include = re.compile(r'^\s*(<(?:.*)>|"(?:.*)")')
 def extract_include(txt, defs):
 	"""
@@ -727,6 +764,12 @@ def parse_char(txt):
 		except KeyError:
 			raise PreprocError('could not parse char literal %r' % txt)
 
+tokenized_lines = Utils.lru_cache(LINE_CACHE_SIZE)
+"""Tokens returned by :py:func:`waflib.Tools.c_preproc.tokenize_private`, by input string"""
+
+evaluated_lines = Utils.lru_cache(LINE_CACHE_SIZE)
+"""Results of :py:meth:`waflib.Tools.c_preproc.c_parser.eval_line`, by #if/#elif expression"""
+
 def tokenize(s):
 	"""
 	Convert a string into a list of tokens (shlex.split does not apply to c/c++/d)
@@ -736,7 +779,11 @@ def tokenize(s):
 	:return: a list of tokens
 	:rtype: list of tuple(token, value)
 	"""
-	return tokenize_private(s)[:] # force a copy of the results
+	try:
+		ret = tokenized_lines[s]
+	except KeyError:
+		ret = tokenized_lines[s] = tokenize_private(s)
+	return ret[:] # force a copy of the results
 
 def tokenize_private(s):
 	ret = []
@@ -794,6 +841,359 @@ def format_defines(lst):
 				raise ValueError('Invalid define expression %r' % y)
 	return ret
 
+def find_guard(lines):
+	"""
+	Detects the include guard of a header, which is a macro whose definition excludes all the
+	preprocessor lines of the file::
+
+		#ifndef FOO_H
+		#define FOO_H
+		...
+		#endif
+
+	:param lines: preprocessor lines returned by :py:meth:`waflib.Tools.c_preproc.c_parser.parse_lines` (in reverse order)
+	:type lines: list of tuple(string, string)
+	:return: the name of the guard, or None
+	:rtype: string
+	"""
+	if len(lines) < 3:
+		return None
+	(token, line) = lines[-1]
+	if token == 'ifndef':
+		m = re_mac.match(line)
+		name = m and m.group()
+	elif token == 'if':
+		m = re_guard.match(line)
+		name = m and (m.group(1) or m.group(2))
+	else:
+		return None
+	if not name:
+		return None
+
+	depth = 1
+	for i in range(len(lines) - 2, 0, -1):
+		token = lines[i][0]
+		if token[:2] == 'if':
+			depth += 1
+		elif token == 'endif':
+			depth -= 1
+			if not depth:
+				# the first block must end on the last line
+				return i == 1 and name or None
+		elif depth == 1 and token[:2] == 'el':
+			return None
+	return None
+
+main_pid = os.getpid()
+"""Process loading this module, the processes forked by :py:meth:`waflib.Runner.Parallel.scan_group` do not write the line stores"""
+
+class lines_store(object):
+	"""
+	Preprocessor lines returned by :py:meth:`waflib.Tools.c_preproc.c_parser.filter_comments`,
+	by hash of the file contents, shared between the builds. The records are appended to
+	the file when they are computed, so that interrupted or failed builds keep them;
+	the file is discarded when it holds more than ``LINE_CACHE_SIZE`` records.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.table = {}
+		self.forked = []
+		"""Records computed in a forked process, see :py:func:`waflib.Tools.c_preproc.export_lines`"""
+		try:
+			data = Utils.readf(path, 'rb')
+		except EnvironmentError:
+			return
+
+		pos = count = 0
+		while pos + 4 <= len(data):
+			size = struct.unpack('>I', data[pos:pos + 4])[0]
+			if pos + 4 + size > len(data):
+				break
+			try:
+				key, lines = cPickle.loads(data[pos + 4:pos + 4 + size])
+			except Exception:
+				break
+			self.table[key] = lines
+			pos += 4 + size
+			count += 1
+
+		if count > LINE_CACHE_SIZE:
+			self.table = {}
+			pos = 0
+		if pos < len(data) and os.getpid() == main_pid:
+			# drop incomplete records (interrupted builds) before appending
+			try:
+				with open(path, 'r+b') as f:
+					f.truncate(pos)
+			except EnvironmentError:
+				self.path = None
+
+	def get(self, key):
+		"""
+		:param key: hash of the file contents
+		:return: the preprocessor lines, or None
+		:rtype: list of tuple(string, string)
+		"""
+		return self.table.get(key)
+
+	def put(self, key, lines):
+		"""
+		Records the preprocessor lines of a file
+
+		:param key: hash of the file contents
+		:param lines: preprocessor lines
+		:type lines: list of tuple(string, string)
+		"""
+		self.table[key] = lines
+		if os.getpid() != main_pid:
+			# the main process writes the records computed by the forked processes
+			self.forked.append((key, lines))
+		elif self.path:
+			data = cPickle.dumps((key, lines), -1)
+			try:
+				with open(self.path, 'ab') as f:
+					f.write(struct.pack('>I', len(data)) + data)
+			except EnvironmentError:
+				self.path = None
+
+def get_lines_store(ctx):
+	"""
+	Returns the :py:class:`waflib.Tools.c_preproc.lines_store` of a build context, or None
+
+	:param ctx: build context
+	:type ctx: :py:class:`waflib.Build.BuildContext`
+	:rtype: :py:class:`waflib.Tools.c_preproc.lines_store`
+	"""
+	try:
+		return ctx.preproc_lines_store
+	except AttributeError:
+		cache_dir = getattr(ctx, 'cache_dir', None)
+		store = ctx.preproc_lines_store = cache_dir and lines_store(os.path.join(cache_dir, LINES_FILE)) or None
+		return store
+
+def export_lines(ctx):
+	"""
+	Returns the preprocessor lines computed by a process forked by :py:meth:`waflib.Runner.Parallel.scan_group`
+	since the previous call, so that the main process records them (see :py:func:`waflib.Tools.c_preproc.import_lines`)
+
+	:param ctx: build context
+	:type ctx: :py:class:`waflib.Build.BuildContext`
+	:return: the records, or None
+	:rtype: list of (key, lines)
+	"""
+	store = get_lines_store(ctx)
+	if store and store.forked:
+		ret = store.forked
+		store.forked = []
+		return ret
+	return None
+
+def import_lines(ctx, records):
+	"""
+	Records the preprocessor lines returned by :py:func:`waflib.Tools.c_preproc.export_lines`
+	in the line store of the main process. The next builds and the processes forked
+	for the next build groups do not have to read the files again.
+
+	:param ctx: build context
+	:type ctx: :py:class:`waflib.Build.BuildContext`
+	:param records: records computed by a forked process
+	:type records: list of (key, lines)
+	"""
+	store = get_lines_store(ctx)
+	if store:
+		for (key, lines) in records:
+			if store.get(key) is None:
+				store.put(key, lines)
+
+dir_listings = {}
+"""Folder contents listed by :py:func:`waflib.Tools.c_preproc.get_listing`, by path, as (modification time, names)"""
+
+fold_case = Utils.is_win32 or Utils.unversioned_sys_platform() == 'darwin'
+"""Whether the file names are compared without case in the folder listings"""
+
+def get_listing(ctx, path):
+	"""
+	Returns the names of the entries of a folder. A folder is listed once for all the scans
+	of a build, and the listing is reused by the next builds of the process while the folder
+	modification time is unchanged.
+
+	:param ctx: build context
+	:type ctx: :py:class:`waflib.Build.BuildContext`
+	:param path: absolute path of the folder
+	:type path: string
+	:return: the names (in lowercase if *fold_case* is set), an empty set if the folder is missing, or None if it cannot be listed
+	:rtype: frozenset or None
+	"""
+	try:
+		cache = ctx.preproc_cache_listings
+	except AttributeError:
+		cache = ctx.preproc_cache_listings = {}
+	try:
+		return cache[path]
+	except KeyError:
+		pass
+
+	try:
+		mtime = os.stat(path).st_mtime
+	except OSError:
+		names = frozenset()
+	else:
+		try:
+			old, names = dir_listings[path]
+		except KeyError:
+			old = None
+		if old != mtime:
+			try:
+				lst = Utils.listdir(path)
+			except OSError:
+				names = None
+			else:
+				if fold_case:
+					lst = [x.lower() for x in lst]
+				names = frozenset(lst)
+				# entries added within the same clock tick would not change the modification time
+				if time.time() - mtime > 2:
+					dir_listings[path] = (mtime, names)
+	cache[path] = names
+	return names
+
+def is_listed(ctx, node, lst):
+	"""
+	Tells from the folder listings whether a path may exist under a folder. The negative answers
+	spare the system calls of :py:meth:`waflib.Node.Node.find_node` for the include paths
+	not containing a header.
+
+	:param ctx: build context
+	:type ctx: :py:class:`waflib.Build.BuildContext`
+	:param node: folder
+	:type node: :py:class:`waflib.Node.Node`
+	:param lst: path components relative to the folder
+	:type lst: list of string
+	:rtype: bool
+	"""
+	path = node.abspath()
+	for x in lst:
+		if x == '..':
+			return True
+		names = get_listing(ctx, path)
+		if names is None:
+			return True
+		if (fold_case and x.lower() or x) not in names:
+			return False
+		path = os.path.join(path, x)
+	return True
+
+class include_frame(object):
+	"""
+	Records what the lines of a header (and of the headers it includes) read from
+	the parser state and what they change, so that the scan of the header can be
+	replayed by :py:meth:`waflib.Tools.c_preproc.c_parser.replay` when it is included again
+	with the same values for the macros it reads.
+	"""
+	__slots__ = ('node', 'depth', 'base', 'peak', 'reads', 'banned', 'writes', 'bans', 'events', 'effects', 'current', 'valid')
+	def __init__(self, node, depth, base):
+		self.node = node
+		self.depth = depth
+		"""Amount of #if blocks open when the header is entered"""
+		self.base = self.peak = base
+		"""Amount of files open when the header is entered, and the maximum reached (see *recursion_limit*)"""
+		self.reads = {}
+		"""Macros read before being modified, and their values"""
+		self.banned = {}
+		"""Headers checked against the #pragma once/#import set before being added to it"""
+		self.writes = set()
+		"""Macros defined or undefined"""
+		self.bans = set()
+		"""Headers added to the #pragma once/#import set"""
+		self.events = []
+		"""Includes found (0, node), not found (1, name) and names added directly (2, name)"""
+		self.effects = None
+		"""Final values of the macros modified"""
+		self.current = None
+		"""Value of *c_parser.current_file* at the end of the header"""
+		self.valid = True
+		"""False when the header cannot be replayed (unbalanced #if blocks, read errors)"""
+
+	def merge(self, frame, peak):
+		"""
+		Adds the records of a header included by this header
+
+		:param frame: frame of the included header
+		:type frame: :py:class:`waflib.Tools.c_preproc.include_frame`
+		:param peak: maximum amount of files open while reading the included header
+		:type peak: int
+		"""
+		self.peak = max(self.peak, peak)
+		reads = self.reads
+		writes = self.writes
+		for name, val in frame.reads.items():
+			if not name in writes and not name in reads:
+				reads[name] = val
+		banned = self.banned
+		bans = self.bans
+		for node, val in frame.banned.items():
+			if not node in bans and not node in banned:
+				banned[node] = val
+		writes.update(frame.writes)
+		bans.update(frame.bans)
+		self.events.extend(frame.events)
+		if not frame.valid:
+			self.valid = False
+
+class macro_table(dict):
+	"""
+	Macro definitions of a :py:class:`waflib.Tools.c_preproc.c_parser`. The macros read and
+	modified are recorded in the frame of the header being parsed (see :py:class:`waflib.Tools.c_preproc.include_frame`).
+	"""
+	__slots__ = ('frame', 'probe')
+	def __init__(self, *k):
+		dict.__init__(self, *k)
+		self.frame = None
+		self.probe = None
+	def record(self, name):
+		if self.probe is not None:
+			self.probe.append(name)
+		f = self.frame
+		if f is not None and not name in f.reads and not name in f.writes:
+			f.reads[name] = dict.get(self, name, undefined_macro)
+	def __contains__(self, name):
+		self.record(name)
+		return dict.__contains__(self, name)
+	def __getitem__(self, name):
+		self.record(name)
+		return dict.__getitem__(self, name)
+	def __setitem__(self, name, value):
+		if self.frame is not None:
+			self.frame.writes.add(name)
+		dict.__setitem__(self, name, value)
+	def __delitem__(self, name):
+		if self.frame is not None:
+			self.frame.writes.add(name)
+		dict.__delitem__(self, name)
+
+def get_include_trees(ctx, nodepaths):
+	"""
+	Returns the include trees recorded for a set of include paths during the build,
+	see :py:meth:`waflib.Tools.c_preproc.c_parser.replay`
+
+	:param ctx: build context
+	:type ctx: :py:class:`waflib.Build.BuildContext`
+	:param nodepaths: include paths
+	:type nodepaths: list of :py:class:`waflib.Node.Node`
+	:return: a dict mapping headers to lists of :py:class:`waflib.Tools.c_preproc.include_frame`
+	:rtype: dict
+	"""
+	try:
+		cache = ctx.preproc_cache_trees
+	except AttributeError:
+		cache = ctx.preproc_cache_trees = {}
+	key = tuple(nodepaths)
+	try:
+		return cache[key]
+	except KeyError:
+		ret = cache[key] = {}
+		return ret
+
 class c_parser(object):
 	"""
 	Used by :py:func:`waflib.Tools.c_preproc.scan` to parse c/h files. Note that by default,
@@ -803,10 +1203,7 @@ class c_parser(object):
 		self.lines = []
 		"""list of lines read"""
 
-		if defines is None:
-			self.defs  = {}
-		else:
-			self.defs  = dict(defines) # make a copy
+		self.defs = macro_table(defines or ()) # make a copy
 		self.state = []
 
 		self.count_files = 0
@@ -830,6 +1227,24 @@ class c_parser(object):
 		self.listed = set()
 		"""Include nodes/names already listed to avoid duplicates in self.nodes/self.names"""
 
+		self.trees = None
+		"""Include trees that may be replayed (see :py:func:`waflib.Tools.c_preproc.get_include_trees`), None to disable"""
+
+		self.frames = []
+		"""Frames of the files being read (None for the source file or when the trees are disabled)"""
+
+		self.active = []
+		"""Frames of the headers being read"""
+
+		self.replayed = None
+		"""Frame of the last header replayed"""
+
+		self.importing = False
+		"""Whether the header found by :py:meth:`waflib.Tools.c_preproc.c_parser.tryfind` is imported (#import)"""
+
+		self.guards = {}
+		"""Include guards of the headers read (see :py:func:`waflib.Tools.c_preproc.find_guard`), shared by the scans of a build"""
+
 	def cached_find_resource(self, node, filename):
 		"""
 		Find a file from the input directory
@@ -850,7 +1265,14 @@ class c_parser(object):
 		try:
 			return cache[key]
 		except KeyError:
-			ret = node.find_resource(filename)
+			lst = [x for x in Utils.split_path(filename) if x and x != '.']
+			if is_listed(node.ctx, node.get_src(), lst):
+				ret = node.find_resource(lst)
+			else:
+				# missing from the source folders, but the file may be declared in the build folder
+				ret = node.get_bld().search_node(lst)
+				if ret and ret.isdir():
+					ret = None
 			if ret:
 				if getattr(ret, 'children', None):
 					ret = None
@@ -877,6 +1299,7 @@ class c_parser(object):
 			# we could let the qt4 module use a subclass, but then the function "scan" below must be duplicated
 			# in the qt4 and in the qt5 classes. So we have two lines here and it is sufficient.
 			self.names.append(filename)
+			self.record(2, filename)
 			return None
 
 		self.curfile = filename
@@ -898,17 +1321,186 @@ class c_parser(object):
 					break
 
 		listed = self.listed
-		if found and not found in self.ban_includes:
+		if found and not self.is_banned(found):
+			self.record(0, found)
 			if found not in listed:
 				listed.add(found)
 				self.nodes.append(found)
 			self.addlines(found)
 		else:
+			self.record(1, filename)
 			if filename not in listed:
 				listed.add(filename)
 				self.names.append(filename)
 		return found
 
+	def record(self, kind, value):
+		"""
+		Records an include in the frame of the header being parsed
+
+		:param kind: 0 for a node found, 1 for a name not found, 2 for a name added directly
+		:type kind: int
+		"""
+		frame = self.defs.frame
+		if frame is not None:
+			frame.events.append((kind, value))
+
+	def is_banned(self, node):
+		"""
+		:return: whether a header is excluded by #pragma once or #import
+		:rtype: bool
+		"""
+		ret = node in self.ban_includes
+		frame = self.defs.frame
+		if frame is not None and not node in frame.bans and not node in frame.banned:
+			frame.banned[node] = ret
+		return ret
+
+	def ban(self, node):
+		"""
+		Excludes a header from further includes (#pragma once or #import)
+		"""
+		self.ban_includes.add(node)
+		frame = self.defs.frame
+		if frame is not None:
+			frame.bans.add(node)
+
+	def replay(self, node):
+		"""
+		Applies the results of a previous scan of a header instead of reading it again,
+		if the macros and the #pragma once headers it depends on have the same values
+
+		:param node: header
+		:type node: :py:class:`waflib.Node.Node`
+		:return: True if the header was replayed
+		:rtype: bool
+		"""
+		defs = self.defs
+		bans = self.ban_includes
+		for frame in self.trees.get(node, ()):
+			peak = self.count_files + 1 + frame.peak - frame.base
+			if peak > recursion_limit:
+				continue
+			for name, val in frame.reads.items():
+				if dict.get(defs, name, undefined_macro) != val:
+					break
+			else:
+				for x, val in frame.banned.items():
+					if (x in bans) != val:
+						break
+				else:
+					break
+		else:
+			return False
+
+		if Logs.verbose:
+			Logs.debug('preproc: replaying file %r', node)
+		for name, val in frame.effects:
+			if val is undefined_macro:
+				if dict.__contains__(defs, name):
+					dict.__delitem__(defs, name)
+			else:
+				dict.__setitem__(defs, name, val)
+		bans.update(frame.bans)
+
+		listed = self.listed
+		for kind, val in frame.events:
+			if kind == 2:
+				self.names.append(val)
+			elif val not in listed:
+				listed.add(val)
+				if kind:
+					self.names.append(val)
+				else:
+					self.nodes.append(val)
+
+		self.replayed = frame
+		if defs.frame is not None:
+			defs.frame.merge(frame, peak)
+		return True
+
+	def end_frame(self):
+		"""
+		Called at the end of a file: the frame of a header is stored for
+		:py:meth:`waflib.Tools.c_preproc.c_parser.replay` and merged into the frame of the including header
+		"""
+		if not self.frames:
+			return
+		frame = self.frames.pop()
+		if frame is None:
+			return
+		self.active.pop()
+		parent = self.defs.frame = self.active[-1] if self.active else None
+
+		if frame.valid and len(self.state) == frame.depth:
+			defs = self.defs
+			frame.effects = [(name, dict.get(defs, name, undefined_macro)) for name in frame.writes]
+			frame.current = self.current_file
+			lst = self.trees.setdefault(frame.node, [])
+			if len(lst) < TREE_ENTRIES:
+				lst.append(frame)
+		else:
+			frame.valid = False
+
+		if parent is not None:
+			parent.merge(frame, frame.peak)
+
+	def invalidate(self):
+		"""
+		Called after a read error: the stack of files is left in an inconsistent state, so the headers
+		being read are not stored and the replays are disabled for the rest of the file
+		"""
+		for frame in self.active:
+			frame.valid = False
+		self.trees = None
+
+	def eval_line(self, line):
+		"""
+		Evaluates an #if/#elif expression by :py:func:`waflib.Tools.c_preproc.eval_macro`. The results
+		are cached with the values of the macros read, and re-used while these values are the same.
+
+		:param line: expression
+		:type line: string
+		:rtype: bool
+		"""
+		defs = self.defs
+		try:
+			entries = evaluated_lines[line]
+		except KeyError:
+			entries = evaluated_lines[line] = []
+
+		for reads, ret in entries:
+			for name, val in reads:
+				if dict.get(defs, name, undefined_macro) != val:
+					break
+			else:
+				for name, val in reads:
+					defs.record(name)
+				break
+		else:
+			defs.probe = probe = []
+			try:
+				ret = eval_macro(tokenize(line), defs)
+			except Exception as e:
+				ret = e
+			finally:
+				defs.probe = None
+
+			seen = set()
+			reads = []
+			for name in probe:
+				if not name in seen:
+					seen.add(name)
+					reads.append((name, dict.get(defs, name, undefined_macro)))
+			if len(entries) >= EVAL_ENTRIES:
+				entries.pop(0)
+			entries.append((reads, ret))
+
+		if isinstance(ret, Exception):
+			# a new exception each time, the cached one would accumulate tracebacks
+			raise PreprocError('Invalid expression %r (%s: %s)' % (line, ret.__class__.__name__, ret))
+		return ret
+
 	def filter_comments(self, node):
 		"""
 		Filter the comments from a c/h file, and return the preprocessor lines.
@@ -926,6 +1518,24 @@ class c_parser(object):
 		code = re_cpp.sub(repl, code)
 		return re_lines.findall(code)
 
+	def stored_filter_comments(self, node):
+		"""
+		Returns the result of :py:meth:`waflib.Tools.c_preproc.c_parser.filter_comments`, reusing the
+		lines stored by previous builds for the same file contents (see :py:class:`waflib.Tools.c_preproc.lines_store`)
+
+		:return: a new list of preprocessor directives as (keyword, line)
+		:rtype: a list of string pairs
+		"""
+		store = get_lines_store(node.ctx)
+		if store is None or use_trigraphs:
+			return self.filter_comments(node)
+		key = Utils.sig_hash(node.read('rb')).digest()
+		lines = store.get(key)
+		if lines is None:
+			lines = self.filter_comments(node)
+			store.put(key, lines)
+		return list(lines)
+
 	def parse_lines(self, node):
 		try:
 			cache = node.ctx.preproc_cache_lines
@@ -934,7 +1544,7 @@ class c_parser(object):
 		try:
 			return cache[node]
 		except KeyError:
-			cache[node] = lines = self.filter_comments(node)
+			cache[node] = lines = self.stored_filter_comments(node)
 			lines.append((POPFILE, ''))
 			lines.reverse()
 			return lines
@@ -947,11 +1557,29 @@ class c_parser(object):
 		:type node: :py:class:`waflib.Node.Node`
 		"""
 
+		if self.importing:
+			# banned before its lines are read, and before a replay
+			self.importing = False
+			self.ban(node)
+
+		guard = self.guards.get(node)
+		if guard and self.count_files < recursion_limit and guard in self.defs:
+			# multiple-include optimization: none of the lines would be processed
+			frame = self.defs.frame
+			if frame is not None:
+				frame.peak = max(frame.peak, self.count_files + 1)
+			return
+
+		header = self.trees is not None and self.currentnode_stack
+		if header and self.replay(node):
+			return
+
 		self.currentnode_stack.append(node.parent)
 
 		self.count_files += 1
 		if self.count_files > recursion_limit:
 			# issue #812
+			self.invalidate()
 			raise PreprocError('recursion limit exceeded')
 
 		if Logs.verbose:
@@ -959,12 +1587,21 @@ class c_parser(object):
 		try:
 			lines = self.parse_lines(node)
 		except EnvironmentError:
+			self.invalidate()
 			raise PreprocError('could not read the file %r' % node)
 		except Exception:
+			self.invalidate()
 			if Logs.verbose > 0:
 				Logs.error('parsing %r failed %s', node, traceback.format_exc())
 		else:
+			if not node in self.guards:
+				self.guards[node] = find_guard(lines)
 			self.lines.extend(lines)
+			frame = None
+			if header:
+				frame = self.defs.frame = include_frame(node, len(self.state), self.count_files)
+				self.active.append(frame)
+			self.frames.append(frame)
 
 	def start(self, node, env):
 		"""
@@ -979,6 +1616,13 @@ class c_parser(object):
 		Logs.debug('preproc: scanning %s (in %s)', node.name, node.parent.name)
 
 		self.current_file = node
+		try:
+			self.guards = node.ctx.preproc_cache_guards
+		except AttributeError:
+			self.guards = node.ctx.preproc_cache_guards = {}
+		if not env.MSVC_VERSION:
+			# the includes of msvc depend on the whole stack of files
+			self.trees = get_include_trees(node.ctx, self.nodepaths)
 		self.addlines(node)
 
 		# macros may be defined on the command-line, so they must be parsed as if they were part of the file
@@ -992,6 +1636,7 @@ class c_parser(object):
 			if token == POPFILE:
 				self.count_files -= 1
 				self.currentnode_stack.pop()
+				self.end_frame()
 				continue
 
 			try:
@@ -1002,6 +1647,11 @@ class c_parser(object):
 					state.append(undefined)
 				elif token == 'endif':
 					state.pop()
+					if self.defs.frame is not None and len(state) < self.defs.frame.depth:
+						self.defs.frame.valid = False
+				elif token[:2] == 'el':
+					if self.defs.frame is not None and len(state) <= self.defs.frame.depth:
+						self.defs.frame.valid = False
 
 				# skip lines when in a dead 'if' branch, wait for the endif
 				if token[0] != 'e':
@@ -1009,7 +1659,7 @@ class c_parser(object):
 						continue
 
 				if token == 'if':
-					ret = eval_macro(tokenize(line), self.defs)
+					ret = self.eval_line(line)
 					if ret:
 						state[-1] = accepted
 					else:
@@ -1028,14 +1678,19 @@ class c_parser(object):
 						state[-1] = accepted
 				elif token == 'include' or token == 'import':
 					(kind, inc) = extract_include(line, self.defs)
+					self.replayed = None
+					self.importing = token == 'import'
 					self.current_file = self.tryfind(inc, kind, env)
-					if token == 'import':
-						self.ban_includes.add(self.current_file)
+					if self.importing:
+						self.importing = False
+						self.ban(self.current_file)
+					if self.replayed is not None:
+						self.current_file = self.replayed.current
 				elif token == 'elif':
 					if state[-1] == accepted:
 						state[-1] = skipped
 					elif state[-1] == ignored:
-						if eval_macro(tokenize(line), self.defs):
+						if self.eval_line(line):
 							state[-1] = accepted
 				elif token == 'else':
 					if state[-1] == accepted:
@@ -1054,7 +1709,7 @@ class c_parser(object):
 						#print "undef %s" % name
 				elif token == 'pragma':
 					if re_pragma_once.match(line.lower()):
-						self.ban_includes.add(self.current_file)
+						self.ban(self.current_file)
 			except Exception as e:
 				if Logs.verbose:
 					Logs.debug('preproc: line parsing failed (%s): %s %s', e, line, traceback.format_exc())
@@ -1089,3 +1744,8 @@ def scan(task):
 	tmp = c_parser(nodepaths)
 	tmp.start(task.inputs[0], task.env)
 	return (tmp.nodes, tmp.names)
+
+# no side effects, the scanner may run in forked processes (see waflib.Runner.Parallel.scan_group)
+scan.process_safe = True
+scan.process_export = export_lines
+scan.process_import = import_lines
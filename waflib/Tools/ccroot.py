@@ -7,7 +7,7 @@ Classes and methods shared by tools providing support for C-like language such
 as C/C++/D/Assembly/Go (this support module is almost never used alone).
 """
 
-import os, re
+import os, re, threading
 from waflib import Task, Utils, Node, Errors, Logs
 from waflib.TaskGen import after_method, before_method, feature, taskgen_method, extension
 from waflib.Tools import c_aliases, c_preproc, c_config, c_osx, c_tests
@@ -123,6 +123,161 @@ def apply_incpaths(self):
 	cwd = self.get_cwd()
 	self.env.INCPATHS = [x.path_from(cwd) for x in lst]
 
+re_depfile_word = re.compile(r'(?:\\[ \t#]|[^\s])+')
+"""Match the file names of a depfile (spaces are escaped)"""
+
+re_depfile_esc = re.compile(r'\\([ \t#])|\$(\$)')
+"""Match the escape sequences of the file names of a depfile"""
+
+depfile_lock = threading.Lock()
+"""Lock for creating the nodes of the dependencies, the depfiles are read by the consumer threads"""
+
+def parse_depfile(lines):
+	"""
+	Parses a makefile written by a compiler (gcc ``-MD``/``-MMD``) line by line, for example::
+
+		foo.o: ../src/foo.c ../src/foo.h \\
+		 ../src/bar\\ baz.h
+		../src/foo.h:
+
+	The rules may be split across several lines, and phony rules (``-MP``) have no prerequisites.
+
+	:param lines: lines to parse, for example a file object
+	:type lines: iterable of string
+	:return: the prerequisites of the rules, in order
+	:rtype: iterator over string
+	"""
+	target = True
+	for line in lines:
+		line = line.rstrip('\r\n')
+		cont = line.endswith('\\')
+		if cont:
+			line = line[:-1]
+		for m in re_depfile_word.finditer(line):
+			word = m.group()
+			if target:
+				# the target of a rule ends with a colon (which may be a drive letter on win32)
+				if word.endswith(':'):
+					target = False
+				continue
+			if '\\' in word or '$' in word:
+				word = re_depfile_esc.sub(lambda m: m.group(1) or m.group(2), word)
+			yield word
+		if not cont:
+			target = True
+
+class compile_task(Task.Task):
+	"""
+	Base class for the c/c++ compilation tasks. The dependencies are read from the depfiles
+	written by the compilers (``-MMD``) when the flags are set in *depfile_var* (gcc and clang
+	set ``CC_DEPS_F``/``CXX_DEPS_F``): the headers used by a compilation are recorded after it
+	has run and are used to detect the changes in the next builds, so that the headers
+	are not scanned by :py:func:`waflib.Tools.c_preproc.scan` anymore. The other compilers
+	(or empty flags) use :py:func:`waflib.Tools.c_preproc.scan` as usual.
+
+	The tasks that were never compiled are scanned by :py:func:`waflib.Tools.c_preproc.scan`
+	too, so that they are ordered after the tasks creating the headers they include.
+	"""
+	depfile_var = None
+	"""Variable name of the flags making the compiler write a depfile (for example ``CC_DEPS_F``)"""
+
+	def uses_depfile(self):
+		"""
+		:return: True if the compiler writes a depfile next to the object file
+		:rtype: bool
+		"""
+		return bool(self.depfile_var and self.env[self.depfile_var])
+
+	def has_depfile_deps(self):
+		"""
+		:return: True if the dependencies of the previous compilation were read from a depfile
+		:rtype: bool
+		"""
+		return self.uses_depfile() and self.uid() in self.generator.bld.node_deps
+
+	def depfile(self):
+		"""
+		:return: the path of the depfile written by the compiler (the object file extension is replaced by *.d*)
+		:rtype: string
+		"""
+		return os.path.splitext(self.outputs[0].abspath())[0] + '.d'
+
+	def scan(self):
+		"""
+		Returns the dependencies read from the depfile of the previous compilation when
+		the compiler writes depfiles, or calls :py:func:`waflib.Tools.c_preproc.scan`
+		(also when the task was never compiled, as no depfile was read yet).
+		The source files that do not exist anymore are removed (the task is then executed again).
+		"""
+		if not self.has_depfile_deps():
+			return c_preproc.scan(self)
+		bld = self.generator.bld
+		nodes = [x for x in bld.node_deps[self.uid()] if x.is_bld() or x.exists()]
+		return (nodes, [])
+	# reading a depfile is quick, only the preprocessor is worth running in other processes
+	scan.process_safe = lambda tsk: not tsk.has_depfile_deps()
+	scan.process_export = c_preproc.export_lines
+	scan.process_import = c_preproc.import_lines
+
+	def post_run(self):
+		"""
+		Reads the depfile written by the compiler and stores the dependencies
+		in ``bld.node_deps`` before the task signature is computed again
+		"""
+		if self.uses_depfile():
+			bld = self.generator.bld
+			try:
+				nodes = self.read_depfile()
+			except EnvironmentError:
+				Logs.warn('Could not read the depfile %r for %r, using the c preprocessor', self.depfile(), self)
+				(nodes, names) = c_preproc.scan(self)
+			Logs.debug('deps: depfile for %s returned %s', self, nodes)
+
+			key = self.uid()
+			bld.node_deps[key] = nodes
+			bld.raw_deps[key] = []
+			try:
+				del self.cache_sig
+			except AttributeError:
+				pass
+		Task.Task.post_run(self)
+
+	def read_depfile(self):
+		"""
+		Reads the depfile written by the compiler by :py:func:`waflib.Tools.ccroot.parse_depfile`.
+		The files located outside of the source and build directories are ignored unless
+		:py:attr:`waflib.Tools.c_preproc.go_absolute` is set, like in :py:func:`waflib.Tools.c_preproc.scan`.
+
+		:return: the nodes of the dependencies, excluding the source file
+		:rtype: list of :py:class:`waflib.Node.Node`
+		"""
+		bld = self.generator.bld
+		cwd = self.get_cwd().abspath()
+		dirs = None
+		if not c_preproc.go_absolute:
+			dirs = tuple(os.path.join(x.abspath(), '') for x in (bld.srcnode, bld.bldnode))
+
+		paths = []
+		seen = set()
+		with open(self.depfile()) as f:
+			for x in parse_depfile(f):
+				x = os.path.normpath(os.path.join(cwd, x))
+				if x in seen or dirs and not x.startswith(dirs):
+					continue
+				seen.add(x)
+				paths.append(x)
+
+		nodes = []
+		src = self.inputs[0]
+		with depfile_lock:
+			for x in paths:
+				node = bld.root.find_node(x)
+				if node is None:
+					Logs.debug('deps: %r from the depfile of %r is missing', x, self)
+				elif node is not src:
+					nodes.append(node)
+		return nodes
+
 class link_task(Task.Task):
 	"""
 	Base class for all link tasks. A task generator is supposed to have at most one link task bound in the attribute *link_task*. See :py:func:`waflib.Tools.ccroot.apply_link`.
@@ -8,7 +8,7 @@
 gcc/llvm detection.
 """
 
-from waflib.Tools import ccroot, ar
+from waflib.Tools import ccroot, ar, c_preproc
 from waflib.Configure import conf
 
 @conf
@@ -29,6 +29,7 @@ def gcc_common_flags(conf):
 
 	v.CC_SRC_F            = []
 	v.CC_TGT_F            = ['-c', '-o']
+	v.CC_DEPS_F           = c_preproc.go_absolute and ['-MD'] or ['-MMD'] # depfiles, see waflib.Tools.ccroot.compile_task
 
 	if not v.LINK_CC:
 		v.LINK_CC = v.CC
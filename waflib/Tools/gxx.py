@@ -8,7 +8,7 @@
 g++/llvm detection.
 """
 
-from waflib.Tools import ccroot, ar
+from waflib.Tools import ccroot, ar, c_preproc
 from waflib.Configure import conf
 
 @conf
@@ -29,6 +29,7 @@ def gxx_common_flags(conf):
 
 	v.CXX_SRC_F           = []
 	v.CXX_TGT_F           = ['-c', '-o']
+	v.CXX_DEPS_F          = c_preproc.go_absolute and ['-MD'] or ['-MMD'] # depfiles, see waflib.Tools.ccroot.compile_task
 
 	if not v.LINK_CXX:
 		v.LINK_CXX = v.CXX
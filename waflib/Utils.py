@@ -60,6 +60,65 @@ else:
 		# Fips? #2213
 		from hashlib import sha1 as md5
 
+try:
+	import mmap
+except ImportError:
+	mmap = None
+
+SIG_HASHES = {}
+"""
+Hash constructors available for the build signatures, by name; see :py:func:`waflib.Utils.set_sig_hash`
+"""
+try:
+	SIG_HASHES['md5'] = md5
+except NameError:
+	pass
+
+try:
+	from hashlib import blake2b as _blake2b
+except ImportError:
+	pass
+else:
+	def blake2b(data=b''):
+		"""BLAKE2b hash object producing digests of the same size as md5"""
+		return _blake2b(data, digest_size=16)
+	SIG_HASHES['blake2b'] = blake2b
+
+try:
+	import xxhash
+except ImportError:
+	pass
+else:
+	SIG_HASHES['xxhash'] = getattr(xxhash, 'xxh3_128', None) or getattr(xxhash, 'xxh128', None) or xxhash.xxh64
+
+sig_hash = SIG_HASHES.get('md5')
+"""Hash constructor used for the task signatures, the task identifiers and :py:func:`waflib.Utils.h_file`/:py:func:`waflib.Utils.h_list`"""
+
+sig_hash_name = 'md5'
+"""Name of :py:data:`waflib.Utils.sig_hash` in :py:const:`waflib.Utils.SIG_HASHES`"""
+
+HASH_READ_SIZE = 1048576
+"""Size of the blocks read by :py:func:`waflib.Utils.h_file`"""
+
+HASH_MMAP_SIZE = 4194304
+"""Files larger than this size are memory-mapped by :py:func:`waflib.Utils.h_file`"""
+
+def set_sig_hash(name):
+	"""
+	Selects the hash algorithm for the build signatures. The choice is made during the
+	configuration and stored in the build cache file, which is discarded when it changes.
+
+	:param name: key in :py:const:`waflib.Utils.SIG_HASHES`
+	:type name: string
+	:raises: :py:class:`waflib.Errors.WafError` if the algorithm is not available
+	"""
+	global sig_hash, sig_hash_name
+	try:
+		sig_hash = SIG_HASHES[name]
+	except KeyError:
+		raise Errors.WafError('The signature hash %r is not available (choose from %s)' % (name, ', '.join(sorted(SIG_HASHES))))
+	sig_hash_name = name
+
 try:
 	import threading
 except ImportError:
@@ -272,18 +331,29 @@ def writef(fname, data, m='w', encoding='latin-1'):
 
 def h_file(fname):
 	"""
-	Computes a hash value for a file by using md5. Use the md5_tstamp
-	extension to get faster build hashes if necessary.
+	Computes a hash value for a file by using :py:data:`waflib.Utils.sig_hash`.
+	Large files are memory-mapped to avoid copying their contents.
 
 	:type fname: string
 	:param fname: path to the file to hash
 	:return: hash of the file contents
 	:rtype: string or bytes
 	"""
-	m = md5()
+	m = sig_hash()
 	with open(fname, 'rb') as f:
+		if mmap and os.fstat(f.fileno()).st_size > HASH_MMAP_SIZE:
+			try:
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except (EnvironmentError, ValueError):
+				pass
+			else:
+				try:
+					m.update(data)
+				finally:
+					data.close()
+				return m.digest()
 		while fname:
-			fname = f.read(200000)
+			fname = f.read(HASH_READ_SIZE)
 			m.update(fname)
 	return m.digest()
 
@@ -332,10 +402,10 @@ def h_file_win32(fname):
 		fd = os.open(fname, os.O_BINARY | os.O_RDONLY | os.O_NOINHERIT)
 	except OSError:
 		raise OSError('Cannot read from %r' % fname)
-	m = md5()
+	m = sig_hash()
 	with os.fdopen(fd, 'rb') as f:
 		while fname:
-			fname = f.read(200000)
+			fname = f.read(HASH_READ_SIZE)
 			m.update(fname)
 	return m.digest()
 
@@ -602,11 +672,11 @@ def h_list(lst):
 	:type lst: list of strings
 	:return: hash of the list
 	"""
-	return md5(repr(lst).encode()).digest()
+	return sig_hash(repr(lst).encode()).digest()
 
 if sys.hexversion < 0x3000000:
 	def h_list_python2(lst):
-		return md5(repr(lst)).digest()
+		return sig_hash(repr(lst)).digest()
 	h_list_python2.__doc__ = h_list.__doc__
 	h_list = h_list_python2
 
@@ -884,7 +954,7 @@ def get_process():
 		return process_pool.pop()
 	except IndexError:
 		filepath = os.path.dirname(os.path.abspath(__file__)) + os.sep + 'processor.py'
-		cmd = [sys.executable, '-c', readf(filepath)]
+		cmd = [sys.executable, '-c', readf(filepath), os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
 		return subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE, bufsize=0, close_fds=not is_win32)
 
 def run_prefork_process(cmd, kwargs, cargs):
@@ -912,8 +982,10 @@ def run_prefork_process(cmd, kwargs, cargs):
 	process_pool.append(proc)
 	lst = cPickle.loads(base64.b64decode(obj))
 	# Jython wrapper failures (bash/execvp)
-	assert len(lst) == 5
-	ret, out, err, ex, trace = lst
+	assert len(lst) == 6
+	ret, out, err, ex, trace, maxrss = lst
+	if maxrss:
+		record_rss(maxrss)
 	if ex:
 		if ex == 'OSError':
 			raise OSError(trace)
@@ -951,6 +1023,89 @@ def lchown(path, user=-1, group=-1):
 		group = entry[2]
 	return os.lchown(path, user, group)
 
+process_stats = getattr(threading, 'local', object)()
+"""
+Thread-local statistics about the sub-processes executed by :py:func:`waflib.Utils.run_process`.
+The attribute ``maxrss`` holds the largest peak resident set size in kilobytes,
+it is reset by :py:meth:`waflib.Task.Task.process` before a task executes.
+"""
+
+def record_rss(maxrss):
+	"""
+	Records the peak resident set size of a sub-process in :py:data:`waflib.Utils.process_stats`
+
+	:param maxrss: value of ``ru_maxrss`` as returned by the system
+	:type maxrss: int
+	"""
+	if sys.platform == 'darwin':
+		# bytes instead of kilobytes
+		maxrss //= 1024
+	if maxrss > getattr(process_stats, 'maxrss', 0):
+		process_stats.maxrss = maxrss
+
+def wait_process(proc, cargs={}):
+	"""
+	Waits for a process like ``proc.communicate(**cargs)``, but reaps it with ``os.wait4``
+	so that the resource usage of that process (and of that process only) is available
+	as ``proc.rusage``. The pipes are read in threads meanwhile. The regular ``communicate``
+	is used when ``os.wait4`` is unavailable or when a timeout is given (``proc.rusage`` is then None).
+	Also used by the pre-forked processes (see :py:func:`waflib.Utils.get_process`).
+
+	:param proc: process object
+	:type proc: subprocess.Popen
+	:param cargs: parameters for ``communicate`` (input, timeout)
+	:type cargs: dict
+	:return: the output and the error output, as returned by ``communicate``
+	:rtype: tuple
+	"""
+	proc.rusage = None
+	if not hasattr(os, 'wait4') or cargs.get('timeout') is not None:
+		return proc.communicate(**cargs)
+
+	ret = {}
+	def read(stream):
+		try:
+			ret[stream] = stream.read()
+		finally:
+			stream.close()
+	threads = []
+	for stream in (proc.stdout, proc.stderr):
+		if stream:
+			t = threading.Thread(target=read, args=(stream,))
+			t.daemon = True
+			t.start()
+			threads.append(t)
+	if proc.stdin:
+		try:
+			if cargs.get('input'):
+				proc.stdin.write(cargs['input'])
+			proc.stdin.close()
+		except EnvironmentError as e:
+			if e.errno not in (errno.EPIPE, errno.EINVAL):
+				raise
+
+	while 1:
+		try:
+			(pid, sts, rusage) = os.wait4(proc.pid, 0)
+		except OSError as e:
+			if e.errno == errno.EINTR:
+				continue
+			if e.errno != errno.ECHILD:
+				raise
+			# reaped elsewhere
+			proc.wait()
+		else:
+			proc.rusage = rusage
+			if os.WIFSIGNALED(sts):
+				proc.returncode = -os.WTERMSIG(sts)
+			else:
+				proc.returncode = os.WEXITSTATUS(sts)
+		break
+
+	for t in threads:
+		t.join()
+	return (proc.stdout and ret.get(proc.stdout), proc.stderr and ret.get(proc.stderr))
+
 def run_regular_process(cmd, kwargs, cargs={}):
 	"""
 	Executes a subprocess command by using subprocess.Popen
@@ -958,7 +1113,7 @@ def run_regular_process(cmd, kwargs, cargs={}):
 	proc = subprocess.Popen(cmd, **kwargs)
 	if kwargs.get('stdout') or kwargs.get('stderr'):
 		try:
-			out, err = proc.communicate(**cargs)
+			out, err = wait_process(proc, cargs)
 		except TimeoutExpired:
 			if kwargs.get('start_new_session') and hasattr(os, 'killpg'):
 				os.killpg(proc.pid, signal.SIGKILL)
@@ -972,7 +1127,8 @@ def run_regular_process(cmd, kwargs, cargs={}):
 	else:
 		out, err = (None, None)
 		try:
-			status = proc.wait(**cargs)
+			wait_process(proc, cargs)
+			status = proc.returncode
 		except TimeoutExpired as e:
 			if kwargs.get('start_new_session') and hasattr(os, 'killpg'):
 				os.killpg(proc.pid, signal.SIGKILL)
@@ -980,6 +1136,8 @@ def run_regular_process(cmd, kwargs, cargs={}):
 				proc.kill()
 			proc.wait()
 			raise e
+	if proc.rusage:
+		record_rss(proc.rusage.ru_maxrss)
 	return status, out, err
 
 def run_process(cmd, kwargs, cargs={}):
@@ -14,7 +14,7 @@ file COPYING for more details. '''
 import json, os, platform, re, sys, unicodedata
 from xml.etree import ElementTree as ET
 from waflib.Configure import conf
-from waflib import Utils, Logs, Errors, TaskGen
+from waflib import Build, Utils, Logs, Errors, TaskGen
 
 def convert_camel (words, upper=False):
     s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', words)
@@ -130,9 +130,27 @@ def prefer_clang(self):
             self.env.CXX = 'clang++'
 
 def get_module_info (ctx, mod):
-    nodes = find (ctx, os.path.join (mod, '%s.h' % mod))
-    infofile = "%s" % nodes[0].relpath()
-    return ModuleInfo (infofile)
+    index = get_module_index (ctx)
+    infofile = index.find (ctx, mod)
+    if infofile == None:
+        nodes = find (ctx, os.path.join (mod, '%s.h' % mod))
+        infofile = "%s" % nodes[0].relpath()
+    return ModuleInfo (infofile, index)
+
+def get_module_graph (ctx, mods=None):
+    '''Returns the dependency graph of the modules in ctx.env.MODULES (cached)'''
+    try:
+        return ctx.juce_module_graph
+    except AttributeError:
+        pass
+
+    if mods == None:
+        mods = ctx.env.MODULES
+    infos = { }
+    for mod in mods:
+        infos[mod] = get_module_info (ctx, mod)
+    ctx.juce_module_graph = JuceModuleGraph (infos)
+    return ctx.juce_module_graph
 
 def plugin_pattern (bld):
     ''' this is only valid after 'juce.py' has been loading during configure'''
@@ -170,6 +188,12 @@ def configure (conf):
     if len (outdir) == 0:
         outdir = "build"
 
+    # module headers are globbed again after each configure
+    try:
+        os.remove (module_index_path (conf))
+    except OSError:
+        pass
+
     # module path
     if not conf.env.JUCE_MODULE_PATH:
         conf.env.JUCE_MODULE_PATH = os.path.join (os.path.expanduser("~"), 'SDKs/JUCE/modules')
@@ -246,14 +270,93 @@ def extract_module_atts (module_header):
     except ValueError:
         return { }
 
+MODULE_INDEX = 'juce_modules.json'
+'''Name of the module metadata index written in the build cache directory'''
+
+def module_index_path (ctx):
+    return os.path.join (ctx.bldnode.abspath(), Build.CACHE_DIR, MODULE_INDEX)
+
+def get_module_index (ctx):
+    '''Returns the module index of this context, loading it on first use.
+       Build contexts write it back after a successful build'''
+    try:
+        return ctx.juce_module_index
+    except AttributeError:
+        pass
+
+    index = ctx.juce_module_index = ModuleIndex (module_index_path (ctx))
+    if hasattr (ctx, 'add_post_fun'):
+        ctx.add_post_fun (lambda bld: index.store())
+    return index
+
+class ModuleIndex:
+    '''Persistent cache of module header locations and declarations.
+
+       Declarations are keyed by header path and revalidated with the
+       header size and mtime, so unchanged headers are never re-read.
+       Header locations are globbed once per configure.'''
+
+    def __init__ (self, path):
+        self.path  = path
+        self.dirty = False
+
+        try:
+            with open (path) as f:
+                data = json.load (f)
+        except (EnvironmentError, ValueError):
+            data = { }
+
+        self.headers = data.get ('headers', { })
+        self.modules = data.get ('modules', { })
+
+    def atts (self, module_header):
+        '''returns the module declaration attributes of a header'''
+        path = os.path.abspath (module_header)
+        try:
+            st = os.stat (path)
+        except OSError:
+            return { }
+
+        entry = self.headers.get (path)
+        if entry != None and entry[0] == st.st_size and entry[1] == st.st_mtime:
+            return entry[2]
+
+        atts = extract_module_atts (path)
+        self.headers[path] = [ st.st_size, st.st_mtime, atts ]
+        self.dirty = True
+        return atts
+
+    def find (self, ctx, mod):
+        '''returns the header path of a module, relative to the project'''
+        key = ctx.env.JUCE_MODULE_PATH
+        headers = self.modules.get (key)
+        if headers == None or (mod in headers and not os.path.exists (headers[mod])):
+            headers = self.modules[key] = { }
+            for node in ctx.path.ant_glob ('%s/**/juce_*.h' % key):
+                if node.name == node.parent.name + '.h':
+                    headers[node.parent.name] = node.relpath()
+            self.dirty = True
+        return headers.get (mod)
+
+    def store (self):
+        if not self.dirty:
+            return
+        data = { 'headers' : self.headers, 'modules' : self.modules }
+        Utils.writef (self.path + '.tmp', json.dumps (data))
+        os.rename (self.path + '.tmp', self.path)
+        self.dirty = False
+
 class ModuleInfo:
     data     = None
     infofile = None
 
-    def __init__ (self, juce_info_file):
+    def __init__ (self, juce_info_file, index=None):
         if os.path.exists (juce_info_file):
             self.infofile = juce_info_file
-            self.data = extract_module_atts (juce_info_file)
+            if index != None:
+                self.data = index.atts (juce_info_file)
+            else:
+                self.data = extract_module_atts (juce_info_file)
 
     def isValid (self):
         return self.data != None and self.data != { } and self.infofile != None
@@ -280,15 +383,8 @@ class ModuleInfo:
         return self.data['dependencies'].replace(',',' ').split()
 
     def requiredPackages (self, debug=False):
-        pkgs = []
-
-        for dep in self.dependencies():
-            pkg = dep #.replace ('_', '-')
-            mv = self.version()[:1]
-            pkg += '_debug-%s' % (mv) if debug else '-%s' % (mv)
-            pkgs.append (pkg)
-
-        return list (set (pkgs))
+        '''returns the pkg-config names of the dependencies of this module'''
+        return JuceModuleGraph ({ self.id() : self }).required_packages (self.id(), debug)
 
     def website (self):
         return self.data ['website']
@@ -350,6 +446,89 @@ class ModuleInfo:
 
         return fwks
 
+class JuceModuleGraph:
+    '''Dependency graph of JUCE modules.
+
+       The topological order and the transitive closures are computed once
+       and cached; dependency cycles are reported when computing the order.
+       Dependencies on modules outside of the graph are kept as leaves.'''
+
+    def __init__ (self, infos):
+        self.infos = infos
+        self.edges = { }
+        for mod in infos:
+            self.edges[mod] = infos[mod].dependencies()
+        self.reset()
+
+    def reset (self):
+        self.sorted   = None
+        self.closures = { }
+
+    def add_dependency (self, mod, dep):
+        '''adds an edge which is not declared in the module headers'''
+        deps = self.edges.setdefault (mod, [])
+        if not dep in deps:
+            deps.append (dep)
+            self.reset()
+
+    def dependencies (self, mod):
+        '''returns the direct dependencies of a module'''
+        return self.edges.get (mod, [])
+
+    def order (self):
+        '''returns all modules, dependencies first'''
+        if self.sorted != None:
+            return self.sorted
+
+        order = []
+        state = { }
+        def visit (mod, path):
+            if state.get (mod) == 2:
+                return
+            if state.get (mod) == 1:
+                cycle = path[path.index (mod):] + [mod]
+                raise Errors.WafError ('Module dependency cycle: %s' % ' -> '.join (cycle))
+            state[mod] = 1
+            for dep in self.dependencies (mod):
+                visit (dep, path + [mod])
+            state[mod] = 2
+            order.append (mod)
+
+        for mod in sorted (self.edges):
+            visit (mod, [])
+
+        for mod in order:
+            closure = set()
+            for dep in self.dependencies (mod):
+                closure.add (dep)
+                closure.update (self.closures[dep])
+            self.closures[mod] = closure
+
+        self.sorted = order
+        return order
+
+    check = order
+
+    def closure (self, mod):
+        '''returns the set of direct and indirect dependencies of a module'''
+        self.order()
+        return self.closures.get (mod, set())
+
+    def link_order (self, mod):
+        '''returns the transitive dependencies of a module, dependents first'''
+        closure = self.closure (mod)
+        return [m for m in reversed (self.order()) if m in closure]
+
+    def required_packages (self, mod, debug=False):
+        '''returns the pkg-config names of the direct dependencies of a module'''
+        mv = self.infos[mod].version()[:1]
+        deps = self.dependencies (mod)
+        pkgs = []
+        for dep in self.order():
+            if dep in deps:
+                pkgs.append (dep + ('_debug-%s' % mv if debug else '-%s' % mv))
+        return pkgs
+
 class Project:
     ctx  = None
     data = None
@@ -551,20 +730,23 @@ class Project:
                 flags += linkFlagsFunc()
         return flags
 
+    def getModuleGraph (self):
+        infos = { }
+        for mod in self.getModules():
+            infos[mod] = self.getModuleInfo (mod)
+        return JuceModuleGraph (infos)
+
     def getUseFlags (self):
         flags = []
 
-        for mod in self.getModules():
-            info = self.getModuleInfo (mod)
-            if is_linux():
-                func = None
-            elif is_mac():
-                func = info.requiredPackages
-            elif is_win32():
-                func = None
-
-            if None != func:
-                flags += func()
+        if is_mac():
+            graph = self.getModuleGraph()
+            for mod in self.getModules():
+                try:
+                    flags += graph.required_packages (mod)
+                except Errors.WafError:
+                    # dependency cycle, the order does not matter here
+                    flags += self.getModuleInfo (mod).requiredPackages()
 
         return list (set (flags))
 
@@ -19,6 +19,10 @@ except AttributeError:
 	class TimeoutExpired(Exception):
 		pass
 
+# the folder containing waflib is given by waflib.Utils.get_process
+sys.path.insert(0, sys.argv[1])
+from waflib.Utils import wait_process
+
 def run():
 	txt = sys.stdin.readline().strip()
 	if not txt:
@@ -32,11 +36,11 @@ def run():
 		kwargs['close_fds'] = False
 
 	ret = 1
-	out, err, ex, trace = (None, None, None, None)
+	out, err, ex, trace, maxrss = (None, None, None, None, 0)
 	try:
 		proc = subprocess.Popen(cmd, **kwargs)
 		try:
-			out, err = proc.communicate(**cargs)
+			out, err = wait_process(proc, cargs)
 		except TimeoutExpired:
 			if kwargs.get('start_new_session') and hasattr(os, 'killpg'):
 				os.killpg(proc.pid, signal.SIGKILL)
@@ -47,6 +51,8 @@ def run():
 			exc.stderr = err
 			raise exc
 		ret = proc.returncode
+		if proc.rusage:
+			maxrss = proc.rusage.ru_maxrss
 	except Exception as e:
 		exc_type, exc_value, tb = sys.exc_info()
 		exc_lines = traceback.format_exception(exc_type, exc_value, tb)
@@ -54,7 +60,7 @@ def run():
 		ex = e.__class__.__name__
 
 	# it is just text so maybe we do not need to pickle()
-	tmp = [ret, out, err, ex, trace]
+	tmp = [ret, out, err, ex, trace, maxrss]
 	obj = base64.b64encode(cPickle.dumps(tmp))
 	sys.stdout.write(obj.decode())
 	sys.stdout.write('\n')